@@ -0,0 +1,43 @@
+"""Micro-benchmark of the HTML extraction backends on the saved pages in benchmarks/fixtures.
+
+    python -m benchmarks.extract [--number 200]
+"""
+
+import argparse
+import timeit
+from pathlib import Path
+
+from src.extract import BACKENDS, extract_article_text, extract_search_results
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def bench(number: int = 200) -> dict:
+    """Milliseconds per page for every backend and page type."""
+    pages = {
+        "article": (extract_article_text, (FIXTURES / "article.html").read_text()),
+        "search": (extract_search_results, (FIXTURES / "search.html").read_text()),
+    }
+    timings = {}
+    for page, (extract, html) in pages.items():
+        reference = extract(html, "bs4")
+        for backend in BACKENDS:
+            assert extract(html, backend) == reference, f"{backend} disagrees with bs4 on the {page} page"
+            seconds = min(timeit.repeat(lambda: extract(html, backend), number=number, repeat=3))
+            timings[(page, backend)] = seconds / number * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200, help="extractions per timing run")
+    args = parser.parse_args()
+
+    timings = bench(args.number)
+    for (page, backend), ms in timings.items():
+        speedup = timings[(page, "bs4")] / ms
+        print(f"{page:8} {backend:6} {ms:8.3f} ms/page  {speedup:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""End-to-end load test of the SSE answer endpoint: how many concurrent chat sessions one instance sustains.
+
+Starts main.py under uvicorn against local stand-ins for radiopaedia.org (the fixture pages) and for the LM
+(an OpenAI-compatible chat completions endpoint that streams the stub responses with a configurable delay),
+then drives concurrent sessions through the chat page, ask and receive_answer, with follow-ups in the same
+conversation, like the browser does.
+
+    python -m benchmarks.load --sessions 20 --followups 1
+    python -m benchmarks.load --sessions 100 --workers 4 --token-ms 20 --json results.json
+
+Reports throughput, time to the first SSE frame and the completion latency (p50/p95/p99) per turn kind, and
+the mean duration of the pipeline stages from the app's /metrics (of one worker, when there are several).
+"""
+
+import argparse
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from .stubs import ANSWER, ARTICLE_HTML, SEARCH_HTML, chat_response
+
+ROOT = Path(__file__).parent.parent
+TOPIC_NAMES = [
+    "hepatic adenoma",
+    "focal nodular hyperplasia",
+    "type 2 endoleak",
+    "critical shoulder angle",
+    "hemorrhagic transformation of ischemic stroke",
+    "pulmonary embolism",
+    "meningioma",
+    "renal cell carcinoma",
+]
+FOLLOWUPS = ["And how does it look on CT?", "What are the differentials?", "How is it followed up?"]
+ASK_URL = re.compile(r'hx-post="([^"]+)"')
+SSE_CONNECT = re.compile(r'sse-connect="([^"]+)"')
+WORD = re.compile(r"\S+\s*")
+
+
+def topic(k: int) -> str:
+    return TOPIC_NAMES[k % len(TOPIC_NAMES)] + (f" {k // len(TOPIC_NAMES)}" if k >= len(TOPIC_NAMES) else "")
+
+
+def lm_response(messages: list[dict], topics: int) -> str:
+    """The stub completion for a chat request, chosen by the output fields DSPy asks for."""
+    system = messages[0]["content"] if messages else ""
+    if "`main_topics`" in system:
+        # the same question always maps to the same topic, different questions spread over `topics` topics
+        k = zlib.crc32(messages[-1]["content"].encode()) % topics
+        return chat_response(reasoning="Topics of the query.", main_topics=json.dumps([topic(k)]))
+    if "`is_faithful`" in system:
+        return chat_response(reasoning="Supported.", is_faithful=True)
+    return chat_response(answer=ANSWER)
+
+
+def completion_chunk(content: str = None, finish_reason: str = None) -> str:
+    delta = {"role": "assistant", "content": content} if content is not None else {}
+    chunk = {
+        "id": "chatcmpl-standin",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "standin",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def standin_app(topics: int = 8, first_token_ms: float = 300, token_ms: float = 10, fetch_ms: float = 50) -> Starlette:
+    """radiopaedia.org search and article pages and an OpenAI-compatible /v1/chat/completions endpoint."""
+
+    async def search(request: Request):
+        await asyncio.sleep(fetch_ms / 1000)
+        # every topic links to its own articles, so new topics are cache misses like in production
+        slug = re.sub(r"\W+", "-", request.query_params.get("q", "").lower()).strip("-")
+        return HTMLResponse(SEARCH_HTML.replace('href="/articles/', f'href="/articles/{slug}--'))
+
+    async def article(request: Request):
+        await asyncio.sleep(fetch_ms / 1000)
+        return HTMLResponse(ARTICLE_HTML)
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        text = lm_response(body.get("messages", []), topics)
+        await asyncio.sleep(first_token_ms / 1000)
+        if not body.get("stream"):
+            await asyncio.sleep(len(WORD.findall(text)) * token_ms / 1000)
+            return JSONResponse(
+                {
+                    "id": "chatcmpl-standin",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "standin",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }
+            )
+
+        async def stream():
+            for word in WORD.findall(text):
+                yield completion_chunk(word)
+                await asyncio.sleep(token_ms / 1000)
+            yield completion_chunk(finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return Starlette(
+        routes=[
+            Route("/search", search),
+            Route("/articles/{slug:path}", article),
+            Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        ]
+    )
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_app(port: int, standin_url: str, workers: int, data_dir: str, env: dict = None) -> subprocess.Popen:
+    """main.py under uvicorn, with its caches in `data_dir` and radiopaedia.org and the LM replaced by the stand-in."""
+    env = {
+        **os.environ,
+        "RADIOPAEDIA_URL": standin_url,
+        "MODEL_NAME": "openai/standin",
+        "OPENAI_API_BASE": f"{standin_url}/v1",
+        "OPENAI_API_KEY": "standin",
+        "GROQ_API_KEY": "standin",
+        "DB_PATH": f"{data_dir}/cache.db",
+        "LM_CACHE_PATH": f"{data_dir}/lm_cache.db",
+        "CONVERSATIONS_DB_PATH": f"{data_dir}/conversations.db",
+        # DSPy's own LM cache would replay the answers of the last run
+        "DSPY_CACHEDIR": f"{data_dir}/dspy_cache",
+        "TRACING_MODE": "file",
+        "TRACE_FILE_DIR": f"{data_dir}/mlruns",
+        **(env or {}),
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    command += ["--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(command, cwd=ROOT, env=env)
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 120.0, interval: float = 0.25):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"the app exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(interval)
+    raise TimeoutError(f"the app did not come up at {url} within {timeout:.0f} s")
+
+
+@dataclass
+class Turn:
+    kind: str  # "first" or "followup"
+    first_frame: float = None  # seconds from sending the question to the first SSE frame
+    completion: float = None  # seconds from sending the question to the close event
+    frames: int = 0
+    error: str = None
+
+
+async def run_turn(client: httpx.AsyncClient, ask_url: str, query: str, conv_id: str, kind: str) -> tuple[Turn, str]:
+    """One question as the browser asks it, returns the turn and the conversation id for the next one."""
+    turn = Turn(kind)
+    start = time.perf_counter()
+    try:
+        response = await client.post(ask_url, data={"query": query, "conv_id": conv_id})
+        response.raise_for_status()
+        url = html.unescape(SSE_CONNECT.search(response.text).group(1))
+        conv_id = parse_qs(urlsplit(url).query)["conv_id"][0]
+        async with client.stream("GET", url) as stream:
+            async for line in stream.aiter_lines():
+                if line == "event: close":
+                    turn.completion = time.perf_counter() - start
+                    break
+                if line.startswith("event:"):
+                    turn.frames += 1
+                    if turn.first_frame is None:
+                        turn.first_frame = time.perf_counter() - start
+        if turn.completion is None:
+            turn.error = "stream ended without a close event"
+    except Exception as e:
+        turn.error = f"{type(e).__name__}: {e}"
+    return turn, conv_id
+
+
+async def run_session(client: httpx.AsyncClient, n: int, followups: int, delay: float) -> list[Turn]:
+    await asyncio.sleep(delay)
+    # the ask and receive_answer routes are registered when the chat page is loaded, the form posts to ask
+    page = await client.get("/app")
+    ask_url = html.unescape(ASK_URL.search(page.text).group(1))
+    turn, conv_id = await run_turn(client, ask_url, f"Question {n}: what are the imaging features of {topic(n)}?", "", "first")
+    turns = [turn]
+    for i in range(followups):
+        if turns[-1].error:
+            break
+        turn, conv_id = await run_turn(client, ask_url, f"{FOLLOWUPS[i % len(FOLLOWUPS)]} ({n}.{i})", conv_id, "followup")
+        turns.append(turn)
+    return turns
+
+
+async def run_load(app_url: str, sessions: int, followups: int, ramp: float = 0.0) -> tuple[list[Turn], float]:
+    """All turns of `sessions` concurrent sessions, started evenly over `ramp` seconds, and the wall time."""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    # requests as htmx sends them, so the app answers with fragments instead of full pages
+    headers = {"HX-Request": "true"}
+    async with httpx.AsyncClient(base_url=app_url, headers=headers, timeout=300.0, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(run_session(client, n, followups, ramp * n / sessions) for n in range(sessions))
+        )
+        return [turn for turns in results for turn in turns], time.perf_counter() - start
+
+
+def percentile(values: list[float], p: float) -> float:
+    """The `p`-th percentile (0-100) by linear interpolation."""
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    k = (len(values) - 1) * p / 100
+    i = int(k)
+    return values[i] + (values[min(i + 1, len(values) - 1)] - values[i]) * (k - i)
+
+
+def summarize(turns: list[Turn], seconds: float) -> dict:
+    """Throughput and latency percentiles (in seconds) of all turns and per turn kind."""
+    ok = [t for t in turns if t.error is None]
+    summary = {
+        "turns": len(turns),
+        "failed": len(turns) - len(ok),
+        "seconds": seconds,
+        "turns_per_second": len(ok) / seconds if seconds else 0.0,
+        "errors": sorted({t.error for t in turns if t.error}),
+    }
+    for kind in ("all", "first", "followup"):
+        selected = [t for t in ok if kind == "all" or t.kind == kind]
+        if not selected:
+            continue
+        summary[kind] = {
+            "count": len(selected),
+            "frames": statistics.mean(t.frames for t in selected),
+            **{
+                f"{metric}_p{p}": percentile([getattr(t, metric) for t in selected], p)
+                for metric in ("first_frame", "completion")
+                for p in (50, 95, 99)
+            },
+        }
+    return summary
+
+
+STAGE_SAMPLE = re.compile(r'^wilhelm_stage_duration_seconds_(sum|count)\{stage="([^"]*)",result="([^"]*)"\} (\S+)$')
+
+
+def stage_means(metrics_text: str) -> dict:
+    """Mean seconds and count per "stage/result" from the app's /metrics (of the worker that answered)."""
+    totals = {}
+    for line in metrics_text.splitlines():
+        if m := STAGE_SAMPLE.match(line):
+            kind, stage, result, value = m.groups()
+            totals.setdefault(f"{stage}/{result}", {})[kind] = float(value)
+    return {key: {"mean": t["sum"] / t["count"], "count": int(t["count"])} for key, t in sorted(totals.items()) if t.get("count")}
+
+
+def print_summary(summary: dict, sessions: int):
+    print(
+        f"{sessions} sessions, {summary['turns']} turns ({summary['failed']} failed) in {summary['seconds']:.1f} s: "
+        f"{summary['turns_per_second']:.2f} turns/s"
+    )
+    print(f"{'':10} {'turns':>6} {'frames':>7}   {'first frame p50/p95/p99 (s)':>28}   {'completion p50/p95/p99 (s)':>27}")
+    for kind in ("all", "first", "followup"):
+        if kind in summary:
+            s = summary[kind]
+            first = "/".join(f"{s[f'first_frame_p{p}']:.2f}" for p in (50, 95, 99))
+            completion = "/".join(f"{s[f'completion_p{p}']:.2f}" for p in (50, 95, 99))
+            print(f"{kind:10} {s['count']:6} {s['frames']:7.1f}   {first:>28}   {completion:>27}")
+    if summary.get("stages"):
+        print(f"{'stage/result':32} {'count':>6} {'mean (s)':>9}")
+        for key, stage in summary["stages"].items():
+            print(f"{key:32} {stage['count']:6} {stage['mean']:9.3f}")
+    for error in summary["errors"]:
+        print(f"error: {error}", file=sys.stderr)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Load test the SSE answer endpoint against local stand-ins.")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent chat sessions")
+    parser.add_argument("--followups", type=int, default=1, help="follow-up questions per session")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which the sessions start")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the app")
+    parser.add_argument("--topics", type=int, default=8, help="distinct topics the stand-in LM picks from")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="stand-in LM latency to the first token")
+    parser.add_argument("--token-ms", type=float, default=10, help="stand-in LM delay per streamed word")
+    parser.add_argument("--fetch-ms", type=float, default=50, help="stand-in radiopaedia.org latency per page")
+    parser.add_argument("--tracing", choices=["file", "server", "off"], default="file", help="TRACING_MODE of the app")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0, help="TRACE_SAMPLE_RATE of the app")
+    parser.add_argument("--app-port", type=int, default=5101)
+    parser.add_argument("--standin-port", type=int, default=5102)
+    parser.add_argument("--data-dir", help="cache and conversation databases of the app (default: a fresh temporary dir)")
+    parser.add_argument("--json", type=Path, help="also write the summary as json to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    standin_url = f"http://127.0.0.1:{args.standin_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    standin = serve_in_thread(standin_app(args.topics, args.first_token_ms, args.token_ms, args.fetch_ms), args.standin_port)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracing = {"TRACING_MODE": args.tracing, "TRACE_SAMPLE_RATE": str(args.trace_sample_rate)}
+        app = start_app(args.app_port, standin_url, args.workers, args.data_dir or tmp, tracing)
+        try:
+            wait_until_up(app_url, app)
+            turns, seconds = asyncio.run(run_load(app_url, args.sessions, args.followups, args.ramp))
+            stages = stage_means(httpx.get(f"{app_url}/metrics").text)
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+            standin.should_exit = True
+
+    summary = summarize(turns, seconds) | {"stages": stages}
+    print_summary(summary, args.sessions)
+    if args.json:
+        args.json.write_text(json.dumps({**summary, "turn_list": [asdict(t) for t in turns]}, indent=2) + "\n")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
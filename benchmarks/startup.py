@@ -0,0 +1,105 @@
+"""Cold start of the app: import times of its modules and the time until a new instance serves requests.
+
+    python -m benchmarks.startup                  # 3 runs each, MLflow tracing against an unreachable server
+    python -m benchmarks.startup --runs 5 --tracing off --json startup.json
+
+Import times are measured in fresh interpreters. "ready" is the time from starting uvicorn until the chat page
+answers. "first turn" is the first question answered by the new instance (against the stand-ins of the load
+test), "second turn" a question after it, so their difference is what the first user still pays for setup.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from .load import ROOT, run_session, serve_in_thread, standin_app, start_app, wait_until_up
+
+MODULES = ["dspy", "mlflow", "src.lib", "main"]
+# nothing listens here, so a tracking server that is down can't delay the startup
+UNREACHABLE_TRACKING_URI = "http://127.0.0.1:9"
+
+
+def import_time(module: str, env: dict) -> float:
+    """Seconds to import `module` in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+async def first_turns(app_url: str) -> tuple[float, float]:
+    """Completion seconds of the first two questions to the app, one after the other."""
+    async with httpx.AsyncClient(base_url=app_url, headers={"HX-Request": "true"}, timeout=300.0) as client:
+        completions = []
+        for n in range(2):
+            turn = (await run_session(client, n, 0, 0.0))[0]
+            if turn.error:
+                raise RuntimeError(f"turn {n + 1} failed: {turn.error}")
+            completions.append(turn.completion)
+    return completions[0], completions[1]
+
+
+def measure_startup(app_port: int, standin_url: str, env: dict) -> dict:
+    """Seconds until a fresh instance (with empty caches) serves the chat page, and its first two turns."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        start = time.perf_counter()
+        app = start_app(app_port, standin_url, 1, data_dir, env)
+        try:
+            wait_until_up(f"http://127.0.0.1:{app_port}/app", app, interval=0.02)
+            ready = time.perf_counter() - start
+            first, second = asyncio.run(first_turns(f"http://127.0.0.1:{app_port}"))
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+    return {"ready": ready, "first_turn": first, "second_turn": second}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Measure import times and the cold start of the app.")
+    parser.add_argument("--runs", type=int, default=3, help="runs per measurement, the median counts")
+    parser.add_argument("--tracing", choices=["file", "server", "off"], default="server", help="TRACING_MODE of the app")
+    parser.add_argument("--app-port", type=int, default=5103)
+    parser.add_argument("--standin-port", type=int, default=5104)
+    parser.add_argument("--json", type=Path, help="also write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    env = {"TRACING_MODE": args.tracing, "MLFLOW_TRACKING_URI": UNREACHABLE_TRACKING_URI}
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        import_env = {
+            **os.environ,
+            **env,
+            "DB_PATH": f"{data_dir}/cache.db",
+            "LM_CACHE_PATH": f"{data_dir}/lm_cache.db",
+            "CONVERSATIONS_DB_PATH": f"{data_dir}/conversations.db",
+        }
+        for module in MODULES:
+            results[f"import {module}"] = statistics.median(import_time(module, import_env) for _ in range(args.runs))
+
+    standin = serve_in_thread(standin_app(first_token_ms=0, token_ms=0, fetch_ms=0), args.standin_port)
+    try:
+        runs = [measure_startup(args.app_port, f"http://127.0.0.1:{args.standin_port}", env) for _ in range(args.runs)]
+    finally:
+        standin.should_exit = True
+    for key in ("ready", "first_turn", "second_turn"):
+        results[key.replace("_", " ")] = statistics.median(run[key] for run in runs)
+
+    for name, seconds in results.items():
+        print(f"{name:20} {seconds:8.3f} s")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+"""Offline stand-ins for radiopaedia.org and the LM, shared by the benchmarks.
+
+radiopaedia.org is replaced by an httpx transport that serves the saved pages in benchmarks/fixtures, the
+LM by litellm mock responses in DSPy's chat format (streamed word by word when DSPy streams)."""
+
+import json
+from pathlib import Path
+
+import dspy
+import httpx
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ARTICLE_HTML = (FIXTURES / "article.html").read_text()
+SEARCH_HTML = (FIXTURES / "search.html").read_text()
+
+TOPICS = ["hepatic adenoma"]
+ANSWER = """**Hepatic adenomas** are benign hormone-induced liver tumors, most often seen in young women taking oral contraceptives.
+
+## Imaging features
+
+- **Ultrasound:** variable echogenicity; hyperechoic with fat, heterogeneous after haemorrhage.
+- **CT:** arterial phase enhancement, isoattenuating on portal venous and delayed phases.
+- **MRI:** the modality of choice
+  - HNF1α-inactivated adenomas lose signal on opposed-phase imaging
+  - inflammatory adenomas are T2 hyperintense with an atoll sign
+  - most adenomas are hypointense in the hepatobiliary phase
+
+## Differentiation from FNH
+
+Focal nodular hyperplasia is iso- to hyperintense in the hepatobiliary phase and often has a central scar, while adenomas are usually hypointense and may contain fat or blood.
+
+## Management
+
+1. Stop oral contraceptives and follow up with imaging.
+2. Resect lesions larger than 5 cm, lesions in men and β-catenin-activated adenomas.
+
+Adenomas larger than 5 cm carry a relevant risk of haemorrhage and malignant transformation to hepatocellular carcinoma."""
+
+
+def chat_response(**fields) -> str:
+    """An LM completion in DSPy's chat adapter format with the given output fields."""
+    return "".join(f"[[ ## {name} ## ]]\n{value}\n\n" for name, value in fields.items()) + "[[ ## completed ## ]]"
+
+
+def stub_lm(response: str) -> dspy.LM:
+    return dspy.LM("openai/stub", api_key="stub", mock_response=response, cache=False)
+
+
+def radiopaedia_handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/search":
+        return httpx.Response(200, text=SEARCH_HTML)
+    return httpx.Response(200, text=ARTICLE_HTML)
+
+
+def install_stubs(lib, answer: str = ANSWER, topics: list[str] = TOPICS, is_faithful: bool = True):
+    """Point `lib`'s http clients at the fixture pages and every predictor of its pipeline at a stub LM."""
+    lib._http_client = httpx.Client(transport=httpx.MockTransport(radiopaedia_handler))
+
+    async def ahandler(request):
+        return radiopaedia_handler(request)
+
+    lib._async_http_client = httpx.AsyncClient(transport=httpx.MockTransport(ahandler))
+    modules = lib.get_pipeline().modules
+    modules.qa.find_articles.set_lm(stub_lm(chat_response(reasoning="Topics of the query.", main_topics=json.dumps(topics))))
+    modules.qa.answer_query.set_lm(stub_lm(chat_response(answer=answer)))
+    modules.check_faithfulness.set_lm(stub_lm(chat_response(reasoning="Supported.", is_faithful=is_faithful)))
+    return modules
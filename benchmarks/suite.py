@@ -0,0 +1,221 @@
+"""Offline benchmarks of the hot components and the full answer stream, with regression thresholds.
+
+    python -m benchmarks.suite                      # run, compare with benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline      # run and store the results as the new baseline
+    python -m benchmarks.suite -k sse -k extract    # only benchmarks whose name contains one of the words
+
+Exits with 1 when a benchmark is slower than its baseline by more than the tolerance (--tolerance, or the
+"tolerance" stored with the baseline entry). Baselines depend on the machine, record them where you compare.
+"""
+
+import os
+
+# everything in memory and no cached LM outputs, before the app modules read their configuration
+os.environ.setdefault("DB_PATH", ":memory:")
+os.environ.setdefault("LM_CACHE_PATH", ":memory:")
+os.environ.setdefault("LM_CACHE_PREDICTORS", "")
+os.environ.setdefault("CONVERSATIONS_DB_PATH", ":memory:")
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import dspy
+from bs4 import BeautifulSoup
+
+from src import lib
+from src.conversations import ConversationManager, SQLiteConversationStore
+from src.db import WriteBehind
+from src.extract import extract_article_text, extract_search_results, structure_search_results
+from src.lib import AnswerChunkEvent, FinalAnswerEvent, SourcesEvent
+from src.streaming import IncrementalAnswer
+from src.utils import event_to_sse
+
+from .stubs import ANSWER, ARTICLE_HTML, SEARCH_HTML, install_stubs
+
+BASELINE = Path(__file__).parent / "baseline.json"
+QUERY = "How can I differentiate hepatic adenoma from FNH on MRI?"
+URL = "https://radiopaedia.org/articles/hepatic-adenoma?lang=us"
+
+
+def answer_prefixes(step: int = 20) -> list[str]:
+    """The answer as the stream delivers it, `step` characters more each time."""
+    return [ANSWER[:i] for i in range(step, len(ANSWER), step)] + [ANSWER]
+
+
+def fresh_cache():
+    """An empty article/search cache, like a fresh deployment."""
+    lib.cache_writes.close()
+    lib.db = lib.open_db(":memory:")
+    lib.cache_writes = WriteBehind(lib.db)
+    lib.article_memory.clear()
+    lib.search_memory.clear()
+    lib.answer_cache.clear()
+
+
+async def answer_stream(query: str = QUERY, history: dspy.History = None) -> list:
+    return [event async for event in lib.aanswer_query(query, history or dspy.History(messages=[]))]
+
+
+def setup_benchmarks() -> dict:
+    """name -> (callable or coroutine function, calls per timing round)."""
+    article_text = extract_article_text(ARTICLE_HTML)
+    search_results = extract_search_results(SEARCH_HTML)
+    prefixes = answer_prefixes()
+    events = [AnswerChunkEvent(answer=p) for p in prefixes]
+    history = dspy.History(messages=[{"user_query": QUERY, "answer": ANSWER, "articles": {"urls": [URL]}}])
+
+    fresh_cache()
+    lib.store_article_text(URL, article_text)
+    lib.cache_writes.submit(lib.write_search_results, "hepatic adenoma", lib.dump_search_results(search_results))
+    lib.cache_writes.flush()
+    cursor = lib.db.cursor()
+
+    def sqlite_article_hit():
+        lib.article_memory.pop(URL)
+        return lib.cached_article_text(URL, cursor)
+
+    def sqlite_search_hit():
+        lib.search_memory.pop("hepatic adenoma")
+        return lib.cached_search_results("hepatic adenoma", cursor)
+
+    def sse_stream(renderer_factory):
+        def render():
+            renderer = renderer_factory()
+            for event in events:
+                event_to_sse(event, renderer)
+            event_to_sse(FinalAnswerEvent(answer=ANSWER, articles={"urls": [URL]}))
+            event_to_sse(SourcesEvent(sources=[lib.Source(title=URL, url=URL)], answer=ANSWER))
+        return render
+
+    def conversation(store_factory):
+        manager = ConversationManager(store=store_factory())
+
+        def turn():
+            conv_id, conv_history = manager.get_or_create_conversation()
+            manager.add_turn(conv_id, conv_history, QUERY, ANSWER, {"urls": [URL]})
+            conv_id, conv_history = manager.get_or_create_conversation(conv_id)
+            manager.add_turn(conv_id, conv_history, "And on CT?", ANSWER, {"urls": [URL]})
+        return turn
+
+    answer_cache = lib.AnswerCache(max_entries=1000)
+    for i in range(1000):
+        answer_cache.put(f"how does condition number {i} look on ct", ANSWER, {"urls": [URL]})
+
+    async def cold_stream():
+        fresh_cache()
+        return await answer_stream()
+
+    async def warm_stream():
+        lib.answer_cache.clear()
+        return await answer_stream()
+
+    async def cached_answer_stream():
+        return await answer_stream()
+
+    async def followup_stream():
+        return await answer_stream("And on CT?", history)
+
+    return {
+        "structure_search_results_bs4": (lambda: structure_search_results(BeautifulSoup(SEARCH_HTML, "html.parser")), 20),
+        "extract_search_results": (lambda: extract_search_results(SEARCH_HTML), 200),
+        "extract_article_text": (lambda: extract_article_text(ARTICLE_HTML), 200),
+        "cached_article_text_memory": (lambda: lib.cached_article_text(URL, cursor), 10_000),
+        "cached_article_text_sqlite": (sqlite_article_hit, 2_000),
+        "cached_search_results_sqlite": (sqlite_search_hit, 2_000),
+        "event_to_sse_full_stream": (sse_stream(lambda: None), 5),
+        "event_to_sse_incremental_stream": (sse_stream(IncrementalAnswer), 20),
+        "conversation_turns_memory": (conversation(lambda: None), 1_000),
+        "conversation_turns_sqlite": (conversation(lambda: SQLiteConversationStore(":memory:")), 500),
+        "answer_cache_near_hit": (lambda: answer_cache.get("how does condition number 500 look on ct?"), 50),
+        "build_prompt_context": (lambda: lib.build_prompt_context(QUERY, history, [URL], [article_text]), 200),
+        "aanswer_query_cold": (cold_stream, 5),
+        "aanswer_query_warm": (warm_stream, 5),
+        "aanswer_query_answer_cache_hit": (cached_answer_stream, 200),
+        "aanswer_query_followup": (followup_stream, 5),
+    }
+
+
+async def measure(fn, number: int, rounds: int) -> float:
+    """Median time per call in microseconds over `rounds` rounds of `number` calls (after one warm-up call)."""
+    is_async = asyncio.iscoroutinefunction(fn)
+    if is_async:
+        await fn()
+    else:
+        fn()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            if is_async:
+                await fn()
+            else:
+                fn()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    return statistics.median(timings)
+
+
+async def run_suite(names: list[str] = None, rounds: int = 5, scale: float = 1.0) -> dict:
+    """Microseconds per call of every benchmark (or those whose name contains one of `names`)."""
+    install_stubs(lib)
+    benchmarks = setup_benchmarks()
+    results = {}
+    for name, (fn, number) in benchmarks.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = await measure(fn, max(1, int(number * scale)), rounds)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Benchmarks that got slower than their baseline by more than the tolerance, as report lines."""
+    regressions = []
+    for name, us in results.items():
+        entry = baseline.get(name)
+        if entry is None:
+            continue
+        limit = entry["us"] * (1 + entry.get("tolerance", tolerance))
+        if us > limit:
+            regressions.append(f"{name}: {us:.1f} us > {limit:.1f} us (baseline {entry['us']:.1f} us)")
+    return regressions
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Offline component benchmarks with regression thresholds.")
+    parser.add_argument("-k", dest="names", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds per benchmark, the median counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale the calls per round (e.g. 0.1 for a quick run)")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown against the baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = asyncio.run(run_suite(args.names, args.rounds, args.scale))
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+
+    for name, us in results.items():
+        entry = baseline.get(name)
+        change = f"{(us / entry['us'] - 1) * 100:+6.1f}%" if entry else "    new"
+        print(f"{name:35} {us:12.1f} us  {change}")
+
+    if args.save_baseline:
+        for name, us in results.items():
+            baseline[name] = {**baseline.get(name, {}), "us": round(us, 1)}
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+from functools import partial
+
+import pytest
+
+import src.lib
+from benchmarks.stubs import install_stubs
+from src.db import WriteBehind
+from src.lib import AnswerPipeline, article_memory, open_db, search_memory
+
+
+@pytest.fixture
+def clean_db(monkeypatch):
+    """A fresh in-memory cache database with its own write-behind queue, and empty in-memory cache tiers."""
+    fresh_db = open_db(":memory:")
+    writes = WriteBehind(fresh_db)
+    monkeypatch.setattr("src.lib.db", fresh_db)
+    monkeypatch.setattr("src.lib.cache_writes", writes)
+    article_memory.clear()
+    search_memory.clear()
+    yield fresh_db.cursor()
+    writes.close()
+
+
+@pytest.fixture
+def stub_pipeline(monkeypatch, clean_db):
+    """A fresh answer pipeline, uncached, against the offline stand-ins of the benchmarks.
+
+    `stub_pipeline(topics=[...])` installs the stubs (see `install_stubs`) and returns the pipeline's modules."""
+    monkeypatch.setattr("src.lib._pipeline", AnswerPipeline())
+    monkeypatch.setattr("src.lib._http_client", src.lib._http_client)
+    monkeypatch.setattr("src.lib._async_http_client", src.lib._async_http_client)
+    monkeypatch.setattr("src.lib.lm_cache.predictors", set())
+    monkeypatch.setattr("src.lib.VERIFY_MODE", "concurrent")
+    src.lib.answer_cache.clear()
+    return partial(install_stubs, src.lib)
@@ -23,14 +23,17 @@ from fasthtml.common import (
     Link,
     H2,
     HttpHeader,
+    Response,
 )
 
 from dotenv import load_dotenv
 from fh_heroicons import Heroicon
+import asyncio
 import os
-import mlflow
 
-from src.lib import setup_db, ConversationManager
+from src.lib import ConversationManager, SQLiteConversationStore, cache_writes, lm_cache, warm_up
+from src import metrics
+from src.tracing import start_tracing
 
 from src.components import (
     QuestionComponent,
@@ -49,20 +52,28 @@ from src.utils import answer_query_sse
 
 load_dotenv()
 
-######## DB STUFF ########
-##########################
-
-c = setup_db(os.getenv("DB_PATH", "data/cache.db"))
-
 ######## Conversation Manager ########
 ######################################
-conversation_manager = ConversationManager()
+# set CONVERSATIONS_DB_PATH to keep conversations across restarts and share them between workers
+conversation_manager = ConversationManager(
+    store=SQLiteConversationStore(os.getenv("CONVERSATIONS_DB_PATH")) if os.getenv("CONVERSATIONS_DB_PATH") else None,
+    max_conversations=int(os.getenv("MAX_CONVERSATIONS", "10000")),
+    idle_ttl=float(os.getenv("CONVERSATION_IDLE_TTL", str(6 * 3600))),
+)
+
+######## Startup ########
+#########################
+# The server accepts requests right away. The DSPy pipeline (get_pipeline(), call .reload() after updating
+# OPT_MODEL_PATH), the cache databases and MLflow tracing (sampled, exported in the background; see
+# TRACING_MODE and TRACE_SAMPLE_RATE) are set up in the background, or by the first request that needs them.
+background_tasks = set()
 
-######## MLFlow Setup ########
-##################################
-mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000"))
-mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "wilhelmai-dev"))
-mlflow.dspy.autolog()
+
+def start_background_setup():
+    for coroutine in (asyncio.to_thread(warm_up), start_tracing()):
+        task = asyncio.create_task(coroutine)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
 
 
 ######## FastHTML App Init ########
@@ -97,6 +108,8 @@ app, rt = fast_app(
     pico=False,
     hdrs=(twcss, sse, *fonts, *meta_tags),
     live=os.getenv("DEVELOPMENT", False),
+    on_startup=[start_background_setup],
+    on_shutdown=[cache_writes.close, lm_cache.close, conversation_manager.close],
     bodykw={"style": bg_style + "font-family: 'Geist', sans-serif;"},
 )
 
@@ -121,7 +134,8 @@ def get():
             sse_connect=receive_answer.to(query=query, conv_id=conv_id),
             sse_swap="message",
             sse_close="close",
-            hx_swap="innerHTML show:bottom",
+            # settle right away, so the targets of incremental answer frames are listening before the next frame
+            hx_swap="innerHTML show:bottom settle:0ms",
         )
 
         if is_followup:
@@ -269,4 +283,10 @@ def index():
     )
 
 
+@rt("/metrics")
+def get():
+    # stage latencies and cache statistics of this worker, in the Prometheus text format
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 serve()
@@ -0,0 +1,131 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from functools import cache
+
+from .search_index import singular
+
+
+@cache
+def vectorizer():
+    """Built on the first lookup, importing sklearn takes about half a second."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    # character n-grams make rephrasings and typos ("meningeoma") land close to each other
+    return HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=2**18, alternate_sign=False)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+# words that don't change what a question asks about; modalities, sides, "normal" or "type" all do
+FUNCTION_WORDS = frozenset(
+    """
+    a an the of on in at to for from with by and or is are was be do does did how what which when where why who
+    can could should would i me my you your it its this that these those between vs versus please
+    """.split()
+)
+
+
+def content_words(query: str) -> set[str]:
+    return {singular(word) for word in normalize_query(query).split() if word not in FUNCTION_WORDS}
+
+
+def is_typo(a: str, b: str) -> bool:
+    """Whether two words are spellings of the same word ("meningeoma", "meningioma"). Short words, numbers,
+    grades and Roman numerals have to match exactly."""
+    return min(len(a), len(b)) >= 5 and SequenceMatcher(None, a, b).ratio() >= 0.85
+
+
+def same_content(a: str, b: str) -> bool:
+    """Whether two queries have the same content words, up to function words, plurals and typos."""
+    words_a, words_b = content_words(a), content_words(b)
+    only_a, only_b = words_a - words_b, words_b - words_a
+    if len(only_a) != len(only_b):
+        return False
+    for word in only_a:
+        match = next((other for other in only_b if is_typo(word, other)), None)
+        if match is None:
+            return False
+        only_b.remove(match)
+    return True
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    articles: dict
+    created_at: float
+
+
+class AnswerCache:
+    """Answers to first-turn questions, looked up by normalized query or, failing that, by the most similar
+    cached query (cosine similarity of character n-grams of at least `threshold`) if it has the same content
+    words (see `same_content`).
+
+    Entries expire after `ttl` seconds, the least recently used entries are evicted beyond `max_entries`."""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 24 * 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[CachedAnswer, object]] = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _expire(self, now: float):
+        expired = [key for key, (entry, _) in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, query: str) -> CachedAnswer | None:
+        key = normalize_query(query)
+        with self._lock:
+            self._expire(time.time())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            from scipy.sparse import vstack
+
+            keys = list(self._entries)
+            similarities = (vstack([vector for _, vector in self._entries.values()]) @ vectorizer().transform([key]).T).toarray().ravel()
+            best = similarities.argmax()
+            # textually close queries can still ask about different things ("type 1 endoleak" or "type 2 endoleak",
+            # "on CT" or "on MRI"), so only the same content words count
+            if similarities[best] >= self.threshold and same_content(keys[best], key):
+                self._entries.move_to_end(keys[best])
+                self.near_hits += 1
+                return self._entries[keys[best]][0]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, answer: str, articles: dict):
+        key = normalize_query(query)
+        entry = CachedAnswer(query=query, answer=answer, articles=articles, created_at=time.time())
+        with self._lock:
+            self._entries[key] = (entry, vectorizer().transform([key]))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+import dspy
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text), cheap enough for every request."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens` tokens, at a paragraph or word boundary where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max(max_tokens, 0) * 4]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    return cut[:boundary] if boundary > len(cut) // 2 else cut
+
+
+@dataclass
+class PromptContext:
+    """What goes into AnswerQuerySig besides the query, and how many tokens of the budget it uses."""
+
+    context: list[str]
+    history: dspy.History
+    context_tokens: int
+    history_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.context_tokens + self.history_tokens
+
+
+def history_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("user_query", "")) + estimate_tokens(message.get("answer", ""))
+
+
+def fit_history(history: dspy.History, max_tokens: int) -> tuple[dspy.History, int]:
+    """Keep the most recent turns that fit into `max_tokens`; the answer of the latest turn is truncated if
+    even that turn alone is too long. Returns the trimmed history and its token count."""
+    kept, used = [], 0
+    for message in reversed(history.messages):
+        tokens = history_tokens(message)
+        if used + tokens > max_tokens:
+            if not kept:
+                answer_budget = max_tokens - estimate_tokens(message.get("user_query", ""))
+                if answer_budget > 0:
+                    message = {**message, "answer": truncate_to_tokens(message.get("answer", ""), answer_budget)}
+                    kept.append(message)
+                    used += history_tokens(message)
+            break
+        kept.append(message)
+        used += tokens
+    return dspy.History(messages=list(reversed(kept))), used
+
+
+def fit_articles(texts: list[str], max_tokens: int) -> list[str]:
+    """Split `max_tokens` evenly across the articles; budget an article doesn't need goes to the others."""
+    fitted = list(texts)
+    remaining, pending = max_tokens, sorted(range(len(texts)), key=lambda i: estimate_tokens(texts[i]))
+    # shortest first, so every article either fits completely or gets its fair share of what is left
+    while pending:
+        share = remaining // len(pending)
+        i = pending.pop(0)
+        fitted[i] = truncate_to_tokens(texts[i], share)
+        remaining -= estimate_tokens(fitted[i])
+    return fitted
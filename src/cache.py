@@ -0,0 +1,120 @@
+import asyncio
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function, every caller that arrives while it is
+    still running waits for and shares its result (or exception)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._acalls: Dict[Hashable, asyncio.Task] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs):
+        """Run `fn(*args, **kwargs)` once per key across threads."""
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._calls[key] = Future()
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs):
+        """Await `fn(*args, **kwargs)` once per key across tasks of the running event loop."""
+        task = self._acalls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._acalls[key] = task
+            task.add_done_callback(lambda _: self._acalls.pop(key, None))
+        # a cancelled waiter must not cancel the call the other waiters depend on
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of keys currently being fetched."""
+        return len(self._calls) + len(self._acalls)
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by entry count and (approximate) size in bytes."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int = None):
+        """Store `value`; `size` defaults to `sys.getsizeof(value)`. Values larger than the cache are not stored."""
+        size = sys.getsizeof(value) if size is None else size
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current size (for logging and metrics)."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,99 @@
+"""Re-encode the cached articles and search results of an existing cache database, and report how well
+they compress and how long decoding takes.
+
+    python -m src.compress_cache --codec zlib            # compress all rows
+    python -m src.compress_cache --codec none            # back to plain text, e.g. before a downgrade
+    python -m src.compress_cache --report                # only report, change nothing
+"""
+
+import argparse
+import os
+import time
+
+from .compression import decode, encode, stored_size
+from .db import Database
+from .lib import open_db
+
+TABLES = {
+    "radiopaedia_articles": ("url", "content"),
+    "radiopaedia_search_results": ("search_query", "search_results"),
+}
+
+
+def table_report(db: Database, table: str) -> dict:
+    """Rows, stored and plain text bytes of `table` and the mean decode time per row in microseconds."""
+    key, column = TABLES[table]
+    rows, stored, plain, seconds = 0, 0, 0, 0.0
+    for (value,) in db.execute(f"SELECT {column} FROM {table}"):
+        start = time.perf_counter()
+        text = decode(value)
+        seconds += time.perf_counter() - start
+        rows += 1
+        stored += stored_size(value)
+        plain += len(text.encode())
+    return {
+        "rows": rows,
+        "stored_bytes": stored,
+        "plain_bytes": plain,
+        "ratio": plain / stored if stored else 1.0,
+        "decode_us": seconds / rows * 1e6 if rows else 0.0,
+    }
+
+
+def recode_table(db: Database, table: str, codec: str, batch_size: int = 500) -> int:
+    """Re-encode every row of `table` with `codec`, in one transaction per batch, returns the changed rows."""
+    key, column = TABLES[table]
+    connection = db.connection()
+    changed, last = 0, None
+    while True:
+        if last is None:
+            rows = db.execute(f"SELECT {key}, {column} FROM {table} ORDER BY {key} LIMIT ?", (batch_size,)).fetchall()
+        else:
+            rows = db.execute(
+                f"SELECT {key}, {column} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?", (last, batch_size)
+            ).fetchall()
+        if not rows:
+            return changed
+        with connection:
+            for row_key, value in rows:
+                recoded = encode(decode(value), codec)
+                if recoded != value:
+                    # rowids stay the same, so the full-text index (over the plain text) stays valid
+                    connection.execute(f"UPDATE {table} SET {column} = ? WHERE {key} = ?", (recoded, row_key))
+                    changed += 1
+        last = rows[-1][0]
+
+
+def print_report(db: Database):
+    for table in TABLES:
+        r = table_report(db, table)
+        print(
+            f"{table}: {r['rows']} rows, {r['stored_bytes'] / 1e6:.2f} MB stored, {r['plain_bytes'] / 1e6:.2f} MB text, "
+            f"ratio {r['ratio']:.2f}x, decode {r['decode_us']:.1f} us/row"
+        )
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Compress or decompress the rows of an existing cache database.")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "data/cache.db"), help="cache database file")
+    parser.add_argument("--codec", choices=["zlib", "none"], default="zlib", help="encoding to convert all rows to")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per transaction")
+    parser.add_argument("--report", action="store_true", help="only report compression ratio and decode cost")
+    parser.add_argument("--vacuum", action="store_true", help="give the freed space back to the file system")
+    args = parser.parse_args(argv)
+
+    # brings databases from before compression (and structured search results) up to date first
+    db = open_db(args.db)
+    print_report(db)
+    if args.report:
+        return 0
+    for table in TABLES:
+        print(f"{table}: re-encoded {recode_table(db, table, args.codec, args.batch_size)} rows as {args.codec}")
+    if args.vacuum:
+        db.execute("VACUUM")
+    print_report(db)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+import zlib
+
+# Cached article texts and search payloads are stored either as TEXT (uncompressed, like all rows written
+# before compression existed) or as a BLOB whose first byte says how the rest is encoded. Readers decode
+# both, so CACHE_COMPRESSION can be switched at any time and old and new rows live side by side.
+FORMAT_ZLIB = 1
+
+# "zlib": compress values of at least COMPRESSION_MIN_BYTES bytes
+# "none": store text as is (readable by versions without compression)
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "none")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "256"))
+ZLIB_LEVEL = 6
+
+_lock = threading.Lock()
+_decoded = 0
+_decode_seconds = 0.0
+
+
+def encode(text: str, codec: str = None) -> str | bytes:
+    """The form of `text` to store, compressed with `codec` (CACHE_COMPRESSION by default)."""
+    codec = codec or CACHE_COMPRESSION
+    if codec == "none":
+        return text
+    if codec != "zlib":
+        raise ValueError(f"unknown cache compression {codec!r}")
+    data = text.encode()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return text
+    return bytes([FORMAT_ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+
+
+def decode(value: str | bytes, max_chars: int = None) -> str:
+    """The text of a stored value; with `max_chars`, only (about) that many characters are decompressed."""
+    global _decoded, _decode_seconds
+    if isinstance(value, str):
+        return value if max_chars is None else value[:max_chars]
+    start = time.perf_counter()
+    if not value or value[0] != FORMAT_ZLIB:
+        raise ValueError(f"unknown cache value format {value[:1]!r}")
+    if max_chars is None:
+        text = zlib.decompress(value[1:]).decode()
+    else:
+        # a utf-8 character has at most four bytes, a cut character at the end is dropped
+        data = zlib.decompressobj().decompress(value[1:], max_chars * 4)
+        text = data.decode(errors="ignore")[:max_chars]
+    with _lock:
+        _decoded += 1
+        _decode_seconds += time.perf_counter() - start
+    return text
+
+
+def stored_size(value: str | bytes) -> int:
+    return len(value.encode()) if isinstance(value, str) else len(value)
+
+
+def stats() -> dict:
+    """Number of decompressed values and the mean time it took, in microseconds."""
+    return {"decoded": _decoded, "mean_decode_us": _decode_seconds / _decoded * 1e6 if _decoded else 0.0}
@@ -0,0 +1,233 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import dspy
+
+from .db import Database, WriteBehind
+
+
+class MemoryConversationStore:
+    """Conversations in a dict of this process, in least recently used order."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conversations: OrderedDict[str, tuple[dspy.History, float]] = OrderedDict()
+
+    def get(self, conversation_id: str) -> Optional[dspy.History]:
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return None
+            self._conversations[conversation_id] = (entry[0], time.time())
+            self._conversations.move_to_end(conversation_id)
+            return entry[0]
+
+    def put(self, conversation_id: str, history: dspy.History):
+        with self._lock:
+            self._conversations[conversation_id] = (history, time.time())
+            self._conversations.move_to_end(conversation_id)
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def items(self) -> Dict[str, dspy.History]:
+        with self._lock:
+            return {conversation_id: history for conversation_id, (history, _) in self._conversations.items()}
+
+    def clear(self):
+        with self._lock:
+            self._conversations.clear()
+
+    def evict(self, max_conversations: int, idle_ttl: float) -> int:
+        """Drop conversations idle for longer than `idle_ttl` seconds and the least recently used ones beyond
+        `max_conversations`. Returns the number of dropped conversations."""
+        now, evicted = time.time(), 0
+        with self._lock:
+            while self._conversations:
+                _, (_, last_used) = next(iter(self._conversations.items()))
+                if len(self._conversations) <= max_conversations and now - last_used <= idle_ttl:
+                    break
+                self._conversations.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def make_room(self, max_conversations: int, idle_ttl: float):
+        self.evict(max_conversations, idle_ttl)
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._conversations)
+
+
+class SQLiteConversationStore:
+    """Conversations in a sqlite table, so they survive restarts and are shared by all worker processes.
+
+    Request handlers never wait for the write lock another worker holds: writes (new turns, the time a
+    conversation was last used and making room for new conversations) are committed by a background thread,
+    and turns that aren't committed yet are read from memory. Other workers see them within a batch delay."""
+
+    def __init__(self, db_path: str):
+        self.db = Database(db_path, setup=self._setup)
+        self.writes = WriteBehind(self.db)
+        self._lock = threading.Lock()
+        # conversation id -> messages as json, for puts that aren't committed yet
+        self._pending: dict[str, str] = {}
+
+    @staticmethod
+    def _setup(cursor):
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (conversation_id TEXT PRIMARY KEY, messages TEXT, last_used REAL)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS conversations_last_used ON conversations (last_used)")
+
+    @staticmethod
+    def _write(cursor, conversation_id: str, messages: str, last_used: float):
+        cursor.execute(
+            "INSERT OR REPLACE INTO conversations (conversation_id, messages, last_used) VALUES (?, ?, ?)",
+            (conversation_id, messages, last_used),
+        )
+
+    @staticmethod
+    def _touch(cursor, conversation_id: str, last_used: float):
+        cursor.execute(
+            "UPDATE conversations SET last_used = max(last_used, ?) WHERE conversation_id = ?", (last_used, conversation_id)
+        )
+
+    @staticmethod
+    def _evict(cursor, max_conversations: int, idle_ttl: float) -> int:
+        cursor.execute("DELETE FROM conversations WHERE last_used < ?", (time.time() - idle_ttl,))
+        evicted = cursor.connection.changes()
+        cursor.execute(
+            "DELETE FROM conversations WHERE conversation_id IN "
+            "(SELECT conversation_id FROM conversations ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_conversations,),
+        )
+        return evicted + cursor.connection.changes()
+
+    def _committed(self, conversation_id: str, messages: str):
+        with self._lock:
+            if self._pending.get(conversation_id) is messages:
+                del self._pending[conversation_id]
+
+    def get(self, conversation_id: str) -> Optional[dspy.History]:
+        with self._lock:
+            messages = self._pending.get(conversation_id)
+        if messages is None:
+            rows = self.db.execute("SELECT messages FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchall()
+            if not rows:
+                return None
+            messages = rows[0][0]
+        self.writes.submit(self._touch, conversation_id, time.time())
+        return dspy.History(messages=json.loads(messages))
+
+    def put(self, conversation_id: str, history: dspy.History):
+        messages = json.dumps(history.messages)
+        with self._lock:
+            self._pending[conversation_id] = messages
+        self.writes.submit(
+            self._write, conversation_id, messages, time.time(), committed=lambda: self._committed(conversation_id, messages)
+        )
+
+    def delete(self, conversation_id: str) -> bool:
+        self.writes.flush()
+        connection = self.db.connection()
+        connection.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+        return connection.changes() > 0
+
+    def items(self) -> Dict[str, dspy.History]:
+        self.writes.flush()
+        rows = self.db.execute("SELECT conversation_id, messages FROM conversations").fetchall()
+        return {conversation_id: dspy.History(messages=json.loads(messages)) for conversation_id, messages in rows}
+
+    def clear(self):
+        self.writes.flush()
+        self.db.execute("DELETE FROM conversations")
+
+    def evict(self, max_conversations: int, idle_ttl: float) -> int:
+        # after the queued writes, so a conversation whose last use is still queued isn't dropped
+        self.writes.flush()
+        connection = self.db.connection()
+        with connection:
+            return self._evict(connection.cursor(), max_conversations, idle_ttl)
+
+    def make_room(self, max_conversations: int, idle_ttl: float):
+        """`evict` on the writer thread, after the writes queued so far."""
+        self.writes.submit(self._evict, max_conversations, idle_ttl)
+
+    def close(self):
+        """Commit the queued writes, e.g. on shutdown."""
+        self.writes.close()
+
+    def __len__(self):
+        self.writes.flush()
+        return self.db.execute("SELECT count(*) FROM conversations").fetchall()[0][0]
+
+
+class ConversationManager:
+    def __init__(self, store=None, max_conversations: int = 10_000, idle_ttl: float = 6 * 3600):
+        self._store = store if store is not None else MemoryConversationStore()
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+
+    def get_or_create_conversation(self, conversation_id: str = None) -> Tuple[str, dspy.History]:
+        """Get existing conversation or create a new one."""
+        if conversation_id:
+            history = self._store.get(conversation_id)
+            if history is not None:
+                return conversation_id, history
+
+        # Create new conversation, making room for it first
+        self._store.make_room(self.max_conversations - 1, self.idle_ttl)
+        new_id = str(uuid.uuid4())
+        history = dspy.History(messages=[])
+        self._store.put(new_id, history)
+        return new_id, history
+
+    def add_turn(self, conversation_id: str, history: dspy.History, user_query: str, answer: str, articles: dict):
+        """Append a turn to the conversation.
+
+        Follow-ups answer from the articles of the first turn, so only the first turn stores them, and only
+        their urls."""
+        message = {"user_query": user_query, "answer": answer}
+        if not history.messages:
+            message["articles"] = {"urls": list(articles["urls"])}
+        history.messages.append(message)
+        self.update_conversation(conversation_id, history)
+
+    def update_conversation(self, conversation_id: str, history: dspy.History):
+        """Update conversation in the store."""
+        self._store.put(conversation_id, history)
+
+    def get_conversation(self, conversation_id: str) -> dspy.History:
+        """Get conversation by ID, raises KeyError if not found."""
+        history = self._store.get(conversation_id)
+        if history is None:
+            raise KeyError(conversation_id)
+        return history
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete conversation by ID. Returns True if deleted, False if not found."""
+        return self._store.delete(conversation_id)
+
+    def list_conversations(self) -> Dict[str, dspy.History]:
+        """Get all conversations (for debugging/admin purposes)."""
+        return self._store.items()
+
+    def evict(self) -> int:
+        """Drop idle and least recently used conversations, returns the number of dropped conversations."""
+        return self._store.evict(self.max_conversations, self.idle_ttl)
+
+    def clear_all(self):
+        """Clear all conversations."""
+        self._store.clear()
+
+    def close(self):
+        """Commit the conversations' queued writes, e.g. on shutdown."""
+        self._store.close()
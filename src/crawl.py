@@ -0,0 +1,226 @@
+"""Pre-warm the radiopaedia.org search and article cache.
+
+    python -m src.crawl data/test_queries.tsv data/extended_qa.json --concurrency 4 --rate 2
+
+Inputs are .tsv files with `topics` and/or `urls` columns (comma separated), .txt files with one topic per
+line and .json files with a list of {"question": ...} objects, whose topics are extracted with the topic
+predictor of the app (this needs the LM). Every topic is searched and its top articles are fetched, just
+like the app does for a question. Finished jobs are appended to the checkpoint file, so an interrupted crawl
+resumes where it stopped."""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from . import lib
+
+
+@dataclass
+class CrawlStats:
+    started_at: float = field(default_factory=time.monotonic)
+    fetched: int = 0
+    extracted: int = 0
+    cached: int = 0
+    resumed: int = 0
+    failed: int = 0
+
+    @property
+    def done(self) -> int:
+        return self.fetched + self.extracted + self.cached + self.resumed + self.failed
+
+    def report(self, total: int) -> str:
+        elapsed = time.monotonic() - self.started_at
+        return (
+            f"{self.done}/{total} jobs ({self.fetched} fetched, {self.extracted} questions, {self.cached} already cached, "
+            f"{self.resumed} done before, {self.failed} failed) in {elapsed:.1f}s, "
+            f"{self.fetched / elapsed if elapsed else 0:.2f} fetches/s"
+        )
+
+
+class RateLimiter:
+    """At most `rate` requests per second, spaced evenly."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def split_list(value: str) -> list[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def load_jobs(path: str) -> tuple[list[str], list[str], list[str]]:
+    """Topics, article urls and questions listed in `path`."""
+    if path.endswith(".tsv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f, delimiter="\t"))
+        return (
+            [topic for row in rows for topic in split_list(row.get("topics"))],
+            [url for row in rows for url in split_list(row.get("urls"))],
+            [],
+        )
+    if path.endswith(".json"):
+        with open(path) as f:
+            return [], [], [item["question"] for item in json.load(f) if item.get("question")]
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()], [], []
+
+
+def load_checkpoint(path: str) -> set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+class Crawler:
+    def __init__(self, concurrency: int = 4, rate: float = 2.0, articles_per_topic: int = 2, checkpoint: str = None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rate)
+        self.articles_per_topic = articles_per_topic
+        self.checkpoint = checkpoint
+        self.done = load_checkpoint(checkpoint)
+        self.stats = CrawlStats()
+        self.total = 0
+
+    def _mark_done(self, key: str):
+        self.done.add(key)
+        if self.checkpoint:
+            with open(self.checkpoint, "a") as f:
+                f.write(key + "\n")
+
+    async def _job(self, key: str, cached, fetch):
+        """Run `fetch()` unless the job is in the checkpoint or `cached()` has its result already."""
+        if key in self.done:
+            self.stats.resumed += 1
+            return None
+        async with self.semaphore:
+            try:
+                result = cached()
+                if result is not None:
+                    self.stats.cached += 1
+                else:
+                    await self.limiter.wait()
+                    result = await fetch()
+                    self.stats.fetched += 1
+            except Exception as e:
+                self.stats.failed += 1
+                logging.warning(f"Crawl job {key!r} failed: {e}")
+                return None
+        self._mark_done(key)
+        return result
+
+    async def article(self, url: str) -> bool:
+        """Fetch an article, returns whether it is done."""
+        cursor = lib.db.cursor()
+        key = f"article\t{url}"
+        await self._job(key, lambda: lib.cached_article_text(url, cursor), lambda: lib.aget_article_text(url, cursor))
+        return key in self.done
+
+    async def topic(self, topic: str) -> bool:
+        """Search a topic and fetch its top articles, returns whether all of it is done."""
+        cursor = lib.db.cursor()
+        key = f"search\t{topic}"
+        # always seed the search table, even if SEARCH_MODE would answer from the local index
+        results = await self._job(
+            key,
+            lambda: lib.cached_search_results(topic, cursor),
+            lambda: lib.search_flights.ado(topic, lib.afetch_search_results, topic, cursor),
+        )
+        if results is None:
+            # resumed (or failed) searches still need their articles, which come from the cache now
+            results = lib.cached_search_results(topic, cursor) or []
+        urls = lib.top_article_urls([results], n=self.articles_per_topic)
+        self.total += len(urls)
+        articles_done = await asyncio.gather(*(self.article(url) for url in urls))
+        return key in self.done and all(articles_done)
+
+    async def question(self, question: str):
+        """Extract the topics of a question and crawl them. The question is checkpointed once all of its
+        topics are done, so a resumed crawl retries the questions with failed topics."""
+        key = f"question\t{question}"
+        if key in self.done:
+            self.stats.resumed += 1
+            return
+        async with self.semaphore:
+            try:
+                # the app's own predictor (with the demos of OPT_MODEL_PATH) through the LM cache, so the
+                # crawler searches the topics the app would and the app finds them cached
+                prediction = await lib.lm_cache.acall(
+                    "generate_search_query", lib.get_pipeline().modules.qa.find_articles.generate_search_query, user_query=question
+                )
+                self.stats.extracted += 1
+            except Exception as e:
+                self.stats.failed += 1
+                logging.warning(f"Crawl job {key!r} failed: {e}")
+                return
+        self.total += len(prediction.main_topics)
+        if all(await asyncio.gather(*(self.topic(topic) for topic in prediction.main_topics))):
+            self._mark_done(key)
+
+    async def run(self, topics: list[str], urls: list[str], questions: list[str] = (), report_every: float = 10.0):
+        topics, urls = list(dict.fromkeys(topics)), list(dict.fromkeys(urls))
+        self.total = len(topics) + len(urls) + len(questions)
+
+        async def report():
+            while True:
+                await asyncio.sleep(report_every)
+                logging.info(f"Crawled {self.stats.report(self.total)}")
+
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(
+                *(self.topic(topic) for topic in topics),
+                *(self.article(url) for url in urls),
+                *(self.question(question) for question in questions),
+            )
+        finally:
+            reporter.cancel()
+            lib.cache_writes.flush()
+            logging.info(f"Crawled {self.stats.report(self.total)}")
+        return self.stats
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Pre-warm the radiopaedia.org search and article cache.")
+    parser.add_argument("inputs", nargs="+", help=".tsv (topics/urls columns), .txt (topics) or .json (questions) files")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight at the same time")
+    parser.add_argument("--rate", type=float, default=2.0, help="radiopaedia.org requests per second, 0 for no limit")
+    parser.add_argument("--articles-per-topic", type=int, default=2, help="top articles fetched per searched topic")
+    parser.add_argument("--checkpoint", default="data/crawl_checkpoint.txt", help="file of finished jobs, to resume")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress reports")
+    args = parser.parse_args(argv)
+
+    topics, urls, questions = [], [], []
+    for path in args.inputs:
+        t, u, q = load_jobs(path)
+        topics, urls, questions = topics + t, urls + u, questions + q
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    crawler = Crawler(
+        concurrency=args.concurrency,
+        rate=args.rate,
+        articles_per_topic=args.articles_per_topic,
+        checkpoint=args.checkpoint,
+    )
+    stats = asyncio.run(crawler.run(topics, urls, questions, report_every=args.report_every))
+    lib.cache_writes.close()
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+import apsw
+import apsw.bestpractice
+
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# switching to WAL and "PRAGMA optimize" in a connection hook fail with SQLITE_BUSY while another worker writes,
+# Database switches to WAL itself and retries
+apsw.bestpractice.apply(
+    tuple(
+        p
+        for p in apsw.bestpractice.recommended
+        if p not in (apsw.bestpractice.connection_wal, apsw.bestpractice.connection_optimize)
+    )
+)
+
+
+class Database:
+    """Connections to one sqlite file: one per thread, in WAL mode with a busy timeout, so any number of
+    threads and worker processes can read while one of them writes.
+
+    `setup` (schema and migrations) runs once, on the first connection. An in-memory database only exists
+    for the connection that created it, so ":memory:" uses a single connection shared by all threads."""
+
+    def __init__(self, db_path: str, setup: Callable[[apsw.Cursor], None] = None, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._setup = setup
+        self._setup_done = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shared = None
+
+    def _retry_busy(self, fn: Callable):
+        # switching to WAL needs an exclusive lock that the busy handler does not wait for, so workers opening
+        # the file at the same moment retry here
+        deadline = time.monotonic() + self.busy_timeout_ms / 1000
+        while True:
+            try:
+                return fn()
+            except apsw.BusyError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+
+    def _connect(self) -> apsw.Connection:
+        # other libraries (fastlite) register connection hooks that switch to WAL, too
+        connection = self._retry_busy(lambda: apsw.Connection(self.db_path))
+        connection.set_busy_timeout(self.busy_timeout_ms)
+        if self.db_path != ":memory:":
+            self._retry_busy(lambda: connection.pragma("journal_mode", "wal"))
+            # with WAL, NORMAL only risks the last transactions on power loss, never corruption
+            connection.pragma("synchronous", "normal")
+        return connection
+
+    def connection(self) -> apsw.Connection:
+        if self.db_path == ":memory:":
+            with self._lock:
+                if self._shared is None:
+                    self._shared = self._connect()
+            connection = self._shared
+        else:
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = self._connect()
+
+        if not self._setup_done:
+            with self._lock:
+                if not self._setup_done:
+                    if self._setup is not None:
+                        self._setup(connection.cursor())
+                    self._setup_done = True
+        return connection
+
+    def cursor(self) -> apsw.Cursor:
+        """A new cursor on this thread's connection (cursors must not be shared between threads)."""
+        return self.connection().cursor()
+
+    def execute(self, sql: str, bindings=None) -> apsw.Cursor:
+        return self.cursor().execute(sql, bindings)
+
+
+class WriteBehind:
+    """Writes queued by request handlers and committed by a background thread, in one transaction per batch
+    of up to `max_rows` writes or `max_delay_ms` milliseconds, whichever comes first.
+
+    `submit` never waits for sqlite. Each write runs in its own savepoint, so a failing write is logged and
+    rolled back without losing the rest of its batch. Call `flush` to wait for queued writes and `close` on
+    shutdown."""
+
+    def __init__(self, db: Database, max_rows: int = 64, max_delay_ms: float = 200):
+        self.db = db
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+
+    def submit(self, write: Callable[..., None], *args, committed: Callable[[], None] = None):
+        """Queue `write(cursor, *args)`. `committed()` is called on the writer thread once the write's batch is
+        committed (or failed)."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WriteBehind is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+        self._queue.put((write, args, committed))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Commit everything queued so far, returns False if that took longer than `timeout` seconds."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = None):
+        """Commit everything queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch, signals, stop = [], [], False
+            item = self._queue.get()
+            deadline = time.monotonic() + self.max_delay
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    signals.append(item)
+                else:
+                    batch.append(item)
+                if stop or signals or len(batch) >= self.max_rows:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for signal in signals:
+                signal.set()
+            if stop:
+                return
+
+    def _write(self, batch: list):
+        connection = self.db.connection()
+        cursor = connection.cursor()
+        try:
+            with connection:
+                for write, args, _ in batch:
+                    try:
+                        with connection:
+                            write(cursor, *args)
+                    except Exception:
+                        self.errors += 1
+                        logging.exception(f"Queued write {write.__name__} failed")
+            self.batches += 1
+            self.rows += len(batch)
+        except Exception:
+            self.errors += len(batch)
+            logging.exception(f"Failed to commit a batch of {len(batch)} writes")
+        for _, _, committed in batch:
+            if committed is not None:
+                committed()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "rows": self.rows, "errors": self.errors, "queued": self._queue.qsize()}
@@ -0,0 +1,156 @@
+import os
+from dataclasses import dataclass
+from typing import Callable
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+@dataclass(frozen=True)
+class ExtractionBackend:
+    """How the article text and the search results are read from radiopaedia.org pages."""
+
+    article_text: Callable[[str], str]
+    search_results: Callable[[str], list[dict]]
+
+
+def structure_search_result(result, idx):
+    return {
+        "id": idx,
+        "title": result.find(class_="search-result-title").text.strip(),
+        "body": result.find(class_="search-result-body").text.strip(),
+        "href": result["href"],
+    }
+
+
+def structure_search_results(soup):
+    return [
+        structure_search_result(search_result, i)
+        for i, search_result in enumerate(soup.find_all(class_="search-result"))
+    ]
+
+
+def bs4_article_text(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    bodies = soup.select("#content > div.body.user-generated-content")
+    if not bodies:
+        raise ValueError("page has no article body")
+    return bodies[0].text.strip()
+
+
+def bs4_search_results(html: str) -> list[dict]:
+    return structure_search_results(BeautifulSoup(html, "html.parser"))
+
+
+# article pages are parsed from the content div on, in chunks, until the article body is complete
+CHUNK_SIZE = 16 * 1024
+
+
+def has_class(element, name: str) -> bool:
+    return name in (element.get("class") or "").split()
+
+
+def is_article_body(element) -> bool:
+    parent = element.getparent()
+    return (
+        element.tag == "div"
+        and has_class(element, "body")
+        and has_class(element, "user-generated-content")
+        and parent is not None
+        and parent.get("id") == "content"
+    )
+
+
+def element_text(element) -> str:
+    """Text of `element` like BeautifulSoup's `.text`: without comments, scripts and styles."""
+    parts = [element.text or ""]
+    for child in element:
+        # comments and processing instructions have a function as tag
+        if isinstance(child.tag, str) and child.tag not in ("script", "style"):
+            parts.append(element_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def from_tag_of(html: str, marker: str, start: int = 0) -> int:
+    """Index of the tag containing the first `marker` after `start`, or -1."""
+    i = html.find(marker, start)
+    return html.rfind("<", 0, i) if i >= 0 else -1
+
+
+def lxml_article_text(html: str) -> str:
+    start = from_tag_of(html, 'id="content"')
+    if start >= 0:
+        parser = etree.HTMLPullParser(events=("end",), tag="div")
+        for offset in range(start, len(html), CHUNK_SIZE):
+            parser.feed(html[offset : offset + CHUNK_SIZE])
+            for _, element in parser.read_events():
+                if is_article_body(element):
+                    return element_text(element).strip()
+    # no content div where we expected one, look at the whole page
+    for element in etree.HTML(html).iter("div"):
+        if is_article_body(element):
+            return element_text(element).strip()
+    raise ValueError("page has no article body")
+
+
+SEARCH_RESULT = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+
+def lxml_search_results(html: str) -> list[dict]:
+    # only the part of the page from the first to the end of the last search result is parsed
+    start = from_tag_of(html, 'class="search-result')
+    if start < 0:
+        return []
+    last = html.rfind('class="search-result')
+    end = html.find("</a>", last)
+    root = etree.HTML(html[start : end + len("</a>") if end >= 0 else len(html)])
+    if root is None:
+        return []
+    results = []
+    for i, result in enumerate(root.xpath(f"//*[{SEARCH_RESULT.format('search-result')}]")):
+        title = result.xpath(f".//*[{SEARCH_RESULT.format('search-result-title')}]")
+        body = result.xpath(f".//*[{SEARCH_RESULT.format('search-result-body')}]")
+        results.append(
+            {
+                "id": i,
+                "title": element_text(title[0]).strip(),
+                "body": element_text(body[0]).strip(),
+                "href": result.attrib["href"],
+            }
+        )
+    return results
+
+
+BACKENDS = {"bs4": ExtractionBackend(bs4_article_text, bs4_search_results)}
+if etree is not None:
+    BACKENDS["lxml"] = ExtractionBackend(lxml_article_text, lxml_search_results)
+
+# "lxml": targeted parsing of only the needed part of the page (default when lxml is installed)
+# "bs4": BeautifulSoup with html.parser over the whole page
+HTML_PARSER = os.getenv("HTML_PARSER", "lxml" if "lxml" in BACKENDS else "bs4")
+
+
+def register_backend(name: str, backend: ExtractionBackend):
+    BACKENDS[name] = backend
+
+
+def get_backend(name: str = None) -> ExtractionBackend:
+    return BACKENDS[name or HTML_PARSER]
+
+
+def as_text(html: str | bytes) -> str:
+    # older cache rows hold the raw bytes of the page, radiopaedia.org serves utf-8
+    return html.decode("utf-8", errors="replace") if isinstance(html, bytes) else html
+
+
+def extract_article_text(html: str | bytes, backend: str = None) -> str:
+    return get_backend(backend).article_text(as_text(html))
+
+
+def extract_search_results(html: str | bytes, backend: str = None) -> list[dict]:
+    return get_backend(backend).search_results(as_text(html))
@@ -0,0 +1,78 @@
+import re
+
+from .search_index import query_terms, singular
+
+# Never (part of) a topic: function and question words, imaging modalities and the generic vocabulary of
+# radiology questions. What remains of a query are mostly the names of diseases, findings and procedures.
+STOPWORDS = frozenset(
+    """
+    a about after all also an and any are as at be been before being best between both but by can could
+    did do does doing done during each else for from had has have having he her his how i if in into is it
+    its just me more most my no not now on only or other our please she should so some such than that the
+    their them then there these they this those to too up us very was we were what what's whats when where
+    which while who whom why will with within without would you your vs versus
+
+    ct cta cect ncct hrct mri mr mra mrcp dwi adc t1 t2 flair swi us ultrasound sonography doppler x-ray
+    xray radiograph radiographs radiography plain film films pet spect scan scans scintigraphy fluoroscopy
+    mammography mammogram angiography imaging image images contrast contrast-enhanced enhanced non-contrast
+    modality modalities sequence sequences
+
+    appearance appearances appear appears look looks looking like seen see shown show shows feature
+    features key classic finding findings sign signs typical typically characteristic characteristics
+    common commonly differentiate differentiating differentiation distinguish distinguishing difference
+    differences differ tell compare comparison differential differentials diagnosis diagnose diagnosed
+    diagnostic criteria classify classified classification grade grading staging stage stages normal
+    abnormal value values measure measured measurement calculate describe explain mean means role use used
+    usage evaluate evaluation assess assessment approach management manage managed treatment treat follow
+    followed know need question questions
+    """.split()
+)
+# joins the words of one topic ("hemorrhagic transformation of ischemic stroke") when it stands between them
+JOINERS = frozenset({"of", "with"})
+# "central and peripheral cholangiocarcinoma" are two topics that share words
+COORDINATORS = frozenset({"and", "or"})
+
+WORD = re.compile(r"\w+(?:[-']\w+)*")
+
+
+def keyword_runs(query: str) -> list[tuple[list[str], str]]:
+    """The runs of words between stopwords, each with the word that ended it."""
+    runs, current = [], []
+    # abbreviations in parentheses repeat the words before them
+    words = WORD.findall(re.sub(r"\([^)]*\)", " ", query.lower()))
+    for i, word in enumerate(words):
+        if word in JOINERS and current and i + 1 < len(words) and words[i + 1] not in STOPWORDS:
+            current.append(word)
+        elif word in STOPWORDS or word in JOINERS:
+            if current:
+                runs.append((current, word))
+            current = []
+        else:
+            current.append(word)
+    if current:
+        runs.append((current, ""))
+    return runs
+
+
+def guess_topics(query: str, max_topics: int = 2) -> list[str]:
+    """Topics guessed from the keywords of a query, without an LM.
+
+    "How can I differentiate hepatic adenoma from FNH on MRI?" gives ["hepatic adenoma", "fnh"], "type 1 and
+    type 2 endoleaks" gives ["type 1 endoleaks", "type 2 endoleaks"]."""
+    runs = keyword_runs(query)
+    topics = []
+    for i, (words, ended_by) in enumerate(runs):
+        following = runs[i + 1][0] if i + 1 < len(runs) else []
+        if ended_by in COORDINATORS and len(words) < len(following) and (len(words) == 1 or words[0] == following[0]):
+            # the words the next run adds to its own first ones belong to this one, too
+            shared = len(words) if words[0] == following[0] else 1
+            words = words + following[shared:]
+        topics.append(" ".join(words))
+    # a number on its own is no topic
+    topics = [topic for topic in dict.fromkeys(topics) if not topic.isdigit()]
+    return topics[:max_topics]
+
+
+def same_topic(a: str, b: str) -> bool:
+    """Whether two topics are the same words in the same order, up to case, punctuation and plurals."""
+    return [singular(word) for word in query_terms(a)] == [singular(word) for word in query_terms(b)]
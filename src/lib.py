@@ -1,15 +1,33 @@
 from dotenv import load_dotenv
+import asyncio
+import atexit
 import logging
 import httpx
-from bs4 import BeautifulSoup
-import apsw
-import apsw.bestpractice
 import dspy
+import importlib
+import json
 import os
-import uuid
-from typing import Dict, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 
 from dataclasses import dataclass
+from dspy.dsp.utils import dotdict
+
+from .cache import LRUCache, SingleFlight
+from .compression import decode as decode_value, encode as encode_value
+from .db import Database, WriteBehind
+from .extract import extract_article_text, extract_search_results, structure_search_result, structure_search_results
+from .conversations import ConversationManager, MemoryConversationStore, SQLiteConversationStore
+from .lm_cache import LMCache
+from . import metrics
+from .tracing import sample_request
+from .answer_cache import AnswerCache, vectorizer as query_vectorizer
+from .budget import PromptContext, estimate_tokens, fit_articles, fit_history
+from .keywords import guess_topics, same_topic
+from .passages import top_passages, vectorizer as passage_vectorizer
+from .search_index import setup_search_index, index_article, rebuild_search_index, search_index, article_title, title_matches
 
 load_dotenv()
 
@@ -44,6 +62,12 @@ class FoundArticleEvent:
     term: str
 
 
+@dataclass
+class CorrectionEvent:
+    answer: str
+    sources: list[Source]
+
+
 @dataclass
 class ErrorEvent:
     message: str
@@ -53,6 +77,12 @@ class StopEvent:
     pass
 
 
+@dataclass
+class Retrieval:
+    articles: dict
+    prompt: PromptContext
+
+
 LogicEvent = (
     AnswerChunkEvent
     | FinalAnswerEvent
@@ -60,60 +90,212 @@ LogicEvent = (
     | FoundArticleEvent
     | ErrorEvent
     | SourcesEvent
+    | CorrectionEvent
     | StopEvent
 )
 
 
-class ConversationManager:
-    def __init__(self):
-        self._conversations: Dict[str, dspy.History] = {}
-
-    def get_or_create_conversation(self, conversation_id: str = None) -> Tuple[str, dspy.History]:
-        """Get existing conversation or create a new one."""
-        if conversation_id and conversation_id in self._conversations:
-            return conversation_id, self._conversations[conversation_id]
+def dump_search_results(results: list[dict]) -> str:
+    """Compact JSON form of structured search results: one [title, body, href] row per result, in rank order."""
+    return json.dumps([[r["title"], r["body"], r["href"]] for r in results], separators=(",", ":"))
 
-        # Create new conversation
-        new_id = str(uuid.uuid4())
-        self._conversations[new_id] = dspy.History(messages=[])
-        return new_id, self._conversations[new_id]
 
-    def update_conversation(self, conversation_id: str, history: dspy.History):
-        """Update conversation in memory."""
-        self._conversations[conversation_id] = history
-
-    def get_conversation(self, conversation_id: str) -> dspy.History:
-        """Get conversation by ID, raises KeyError if not found."""
-        return self._conversations[conversation_id]
+def load_search_results(payload: str) -> list[dict]:
+    return [
+        {"id": i, "title": title, "body": body, "href": href}
+        for i, (title, body, href) in enumerate(json.loads(payload))
+    ]
 
-    def delete_conversation(self, conversation_id: str) -> bool:
-        """Delete conversation by ID. Returns True if deleted, False if not found."""
-        return self._conversations.pop(conversation_id, None) is not None
 
-    def list_conversations(self) -> Dict[str, dspy.History]:
-        """Get all conversations (for debugging/admin purposes)."""
-        return self._conversations.copy()
+SCHEMA_VERSION = 2
 
-    def clear_all(self):
-        """Clear all conversations."""
-        self._conversations.clear()
+def migrate_db(cursor):
+    """Bring an existing cache database up to SCHEMA_VERSION (tracked in `PRAGMA user_version`).
 
-def setup_db(db_path=":memory:"):
-    apsw.bestpractice.apply(apsw.bestpractice.recommended)
-    connection = apsw.Connection(db_path)
-    cursor = connection.cursor()
+    Runs in an immediate transaction, so when several workers start at once one migrates and the others
+    wait for it (busy timeout) and then find the database up to date."""
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        version = cursor.execute("PRAGMA user_version").fetchall()[0][0]
+        if version < 1:
+            # search results used to be cached as the raw html of the search page
+            rows = cursor.execute("SELECT search_query, search_results FROM radiopaedia_search_results").fetchall()
+            for search_query, rbody in rows:
+                results = extract_search_results(rbody)
+                cursor.execute(
+                    "UPDATE radiopaedia_search_results SET search_results = ? WHERE search_query = ?",
+                    (dump_search_results(results), search_query),
+                )
+            cursor.execute("PRAGMA user_version = 1")
+            if rows:
+                logging.info(f"Migrated {len(rows)} cached search results to structured rows")
+        if version < 2:
+            setup_search_index(cursor)
+            indexed = rebuild_search_index(cursor, load_content=decode_value)
+            cursor.execute("PRAGMA user_version = 2")
+            if indexed:
+                logging.info(f"Indexed {indexed} cached articles for local search")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    cursor.execute("COMMIT")
+
+
+def setup_schema(cursor):
     cursor.execute(
         "CREATE TABLE IF NOT EXISTS radiopaedia_search_results (search_query TEXT PRIMARY KEY, search_results TEXT)"
     )
     cursor.execute(
         "CREATE TABLE IF NOT EXISTS radiopaedia_articles (url TEXT PRIMARY KEY, content TEXT)"
     )
-    return cursor
+    migrate_db(cursor)
+
+
+def open_db(db_path=":memory:") -> Database:
+    """The article and search cache, with per-thread connections (see `Database`)."""
+    return Database(db_path, setup=setup_schema)
 
+
+def setup_db(db_path=":memory:"):
+    return open_db(db_path).cursor()
+
+# in-process tier in front of the sqlite cache tables
+article_memory = LRUCache(
+    max_entries=int(os.getenv("ARTICLE_MEMORY_ENTRIES", "256")),
+    max_bytes=int(os.getenv("ARTICLE_MEMORY_BYTES", str(32 * 1024 * 1024))),
+)
+search_memory = LRUCache(
+    max_entries=int(os.getenv("SEARCH_MEMORY_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("SEARCH_MEMORY_BYTES", str(8 * 1024 * 1024))),
+)
+
+# "network": always ask radiopaedia.org on a search cache miss
+# "local_first": answer from the full-text index over cached articles, fall back to the network on low recall
+# "local": never go to the network for searches (offline operation)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "network")
+LOCAL_SEARCH_MIN_RESULTS = int(os.getenv("LOCAL_SEARCH_MIN_RESULTS", "2"))
+
+# number of article passages passed to the answer model, 0 passes the full articles
+PASSAGE_TOP_K = int(os.getenv("PASSAGE_TOP_K", "8"))
+
+# token budget for context + history passed to the answer model, and the share of it prior turns may use
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+HISTORY_BUDGET_SHARE = float(os.getenv("HISTORY_BUDGET_SHARE", "0.25"))
+
+# "concurrent": stream the first answer right away, check its faithfulness in the background and only
+#               regenerate (and send a CorrectionEvent) if the check fails
+# "refine": dspy.Refine, every attempt is checked before the answer is final
+VERIFY_MODE = os.getenv("VERIFY_MODE", "concurrent")
+MAX_ANSWER_ATTEMPTS = int(os.getenv("MAX_ANSWER_ATTEMPTS", "3"))
+
+# answers to first-turn questions, replayed for repeated and near-duplicate questions
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_ENTRIES", "1000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+)
+
+# "serial": search only after the LM extracted the topics
+# "speculative": while the LM extracts the topics of a first question, search the topics guessed from its
+#                keywords (and fetch their top articles); searches that agree with the LM's topics are kept.
+#                Guesses that don't agree still cost radiopaedia.org a search and up to two article fetches
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "serial")
+
+MAX_PARALLEL_SEARCHES = int(os.getenv("MAX_PARALLEL_SEARCHES", "4"))
+# where articles are searched and fetched, e.g. a local stand-in for load tests
+RADIOPAEDIA_URL = os.getenv("RADIOPAEDIA_URL", "https://radiopaedia.org").rstrip("/")
 MODEL = os.getenv("MODEL_NAME", "groq/moonshotai/kimi-k2-instruct-0905")
 lm = dspy.LM(MODEL, api_key=os.getenv("GROQ_API_KEY"))
+# the thread that configures DSPy first owns its settings; configuring at import makes that the main thread,
+# which also runs the event loop (see tracing.start_tracing)
 dspy.configure(lm=lm)
-c = setup_db(os.getenv("DB_PATH", "data/cache.db"))
+
+
+class TaskLocalOverrides:
+    """DSPy's per-thread settings overrides (`dspy.context`), kept per asyncio task and thread instead.
+
+    `dspy.streamify` holds a `dspy.context` across awaits on the event loop thread. With several answers
+    streaming at once their contexts are left in the wrong order, and the thread keeps a stale copy of the
+    settings from then on, e.g. without callbacks configured after startup."""
+
+    _overrides: ContextVar[dotdict] = ContextVar("dspy_overrides")
+
+    @property
+    def overrides(self) -> dotdict:
+        return self._overrides.get(dotdict())
+
+    @overrides.setter
+    def overrides(self, value: dotdict):
+        self._overrides.set(value)
+
+
+# replaces a private of DSPy, so only on the versions it was checked against (as an attribute,
+# `dspy.dsp.utils.settings` is the Settings instance, not the module)
+settings_module = importlib.import_module("dspy.dsp.utils.settings")
+if dspy.__version__.startswith("2.6.") and hasattr(settings_module, "thread_local_overrides"):
+    settings_module.thread_local_overrides = TaskLocalOverrides()
+else:
+    logging.warning(f"Not keeping DSPy contexts per task: untested DSPy version {dspy.__version__}")
+
+# connects (and migrates) on first use, see warm_up
+db = open_db(os.getenv("DB_PATH", "data/cache.db"))
+
+# fetched articles and search results are written to the cache off the request path, in batched transactions
+cache_writes = WriteBehind(
+    db,
+    max_rows=int(os.getenv("CACHE_WRITE_BATCH_ROWS", "64")),
+    max_delay_ms=float(os.getenv("CACHE_WRITE_BATCH_MS", "200")),
+)
+atexit.register(lambda: cache_writes.close())
+
+# outputs of the (effectively deterministic) predictors listed in LM_CACHE_PREDICTORS, shared by all workers
+lm_cache = LMCache(
+    os.getenv("LM_CACHE_PATH", "data/lm_cache.db"),
+    predictors=set(filter(None, os.getenv("LM_CACHE_PREDICTORS", "generate_search_query,check_faithfulness").split(","))),
+    max_entries=int(os.getenv("LM_CACHE_ENTRIES", "100000")),
+    ttl=float(os.getenv("LM_CACHE_TTL", str(30 * 24 * 3600))),
+)
+atexit.register(lambda: lm_cache.close())
+
+
+@metrics.register_collector
+def cache_metrics() -> list[metrics.Family]:
+    """Hit ratios of the article and search caches and the counters of the caches' `stats()`, for /metrics."""
+    memory = {"article": article_memory.stats(), "search": search_memory.stats()}
+    answers = answer_cache.stats()
+    lm = lm_cache.stats()
+    writes = cache_writes.stats()
+    return [
+        metrics.gauge(
+            "wilhelm_cache_hit_ratio",
+            "Share of article fetches and searches served from the cache (memory, sqlite or the local index).",
+            [({"cache": "article"}, metrics.hit_ratio("article_fetch")), ({"cache": "search"}, metrics.hit_ratio("search", ("hit", "local")))],
+        ),
+        metrics.counter(
+            "wilhelm_memory_cache_lookups",
+            "Lookups in the in-process tier in front of the sqlite cache tables.",
+            [({"cache": c, "result": r}, stats[key]) for c, stats in memory.items() for r, key in (("hit", "hits"), ("miss", "misses"))],
+        ),
+        metrics.gauge(
+            "wilhelm_memory_cache_bytes",
+            "Approximate size of the in-process cache tier.",
+            [({"cache": c}, stats["bytes"]) for c, stats in memory.items()],
+        ),
+        metrics.counter(
+            "wilhelm_answer_cache_lookups",
+            "Lookups of first-turn questions in the answer cache.",
+            [({"result": "hit"}, answers["hits"]), ({"result": "near_hit"}, answers["near_hits"]), ({"result": "miss"}, answers["misses"])],
+        ),
+        metrics.counter(
+            "wilhelm_lm_cache_lookups",
+            "Lookups of predictor outputs in the LM cache.",
+            [({"result": "hit"}, lm["hits"]), ({"result": "miss"}, lm["misses"])],
+        ),
+        metrics.counter("wilhelm_cache_writes", "Rows written to the cache tables off the request path.", [({}, writes["rows"])]),
+        metrics.counter("wilhelm_cache_write_errors", "Failed queued cache writes.", [({}, writes["errors"])]),
+        metrics.gauge("wilhelm_cache_writes_queued", "Cache writes waiting for the writer thread.", [({}, writes["queued"])]),
+    ]
+
 
 class SearchQuerySig(dspy.Signature):
     """Extract one or two main topics (diseases, procedures, phenomenon etc.) from the user query.
@@ -139,29 +321,175 @@ class RadiopaediaArticleFinder(dspy.Module):
         self.generate_search_query = dspy.ChainOfThought(SearchQuerySig)
 
     def forward(self, user_query: str):
-        topics = self.generate_search_query(user_query=user_query).main_topics
-
-        urls = []
-        for topic in topics:
-            results = search_results(search_term=topic, cursor=c)
-            urls.extend(f"https://radiopaedia.org{r['href']}" for r in results[:2])
+        start_time = time.perf_counter()
+        topics = lm_cache.call("generate_search_query", self.generate_search_query, user_query=user_query).main_topics
+        metrics.record_stage("topic_extraction", start_time)
+
+        def search(topic):
+            return search_results(search_term=topic, cursor=db.cursor())
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(topics), MAX_PARALLEL_SEARCHES))) as pool:
+            results_per_topic = list(pool.map(search, topics))
+
+        return dspy.Prediction(urls=top_article_urls(results_per_topic), main_topics=topics)
+
+    async def aforward(self, user_query: str):
+        async for item in self.astream(user_query):
+            prediction = item
+        return prediction
+
+    async def astream(self, user_query: str):
+        """`aforward` with its progress: yields a SearchEvent for the topics searched, a FoundArticleEvent per
+        topic with results and the Prediction last.
+
+        In "speculative" RETRIEVAL_MODE the topics guessed from the query are searched while the LM extracts
+        the topics, see `Speculation`."""
+        cursor = db.cursor()
+        speculation = Speculation(guess_topics(user_query) if RETRIEVAL_MODE == "speculative" else [], cursor)
+        try:
+            if speculation.searches:
+                yield SearchEvent(terms=list(speculation.searches))
+            start_time = time.perf_counter()
+            topics = (await lm_cache.acall("generate_search_query", self.generate_search_query, user_query=user_query)).main_topics
+            metrics.record_stage("topic_extraction", start_time)
+            started = {topic: search for topic in topics if (search := speculation.take(topic)) is not None}
+            speculation.discard()
+            if new_topics := [topic for topic in topics if topic not in started]:
+                yield SearchEvent(terms=new_topics)
+            results_per_topic = await asearch_topics(topics, cursor, started)
+            for topic, results in zip(topics, results_per_topic):
+                if results:
+                    yield FoundArticleEvent(term=topic)
+            yield dspy.Prediction(urls=top_article_urls(results_per_topic), main_topics=topics)
+        finally:
+            speculation.cancel()
+
+
+class Speculation:
+    """Searches for topics guessed from a query (see `keywords.guess_topics`), started before the LM extracted
+    its topics. The top articles of every search are fetched into the cache as soon as its results are in.
+
+    `take` hands over the search of a guess that agrees with a topic of the LM, `discard` cancels the others.
+    Searches and fetches already sent upstream still finish (see `SingleFlight`) and only fill the caches."""
+
+    def __init__(self, guesses: list[str], cursor):
+        self.start_time = time.perf_counter()
+        self.cursor = cursor
+        self.searches = {guess: asyncio.create_task(asearch_results(guess, cursor)) for guess in guesses}
+        self.prefetches = {guess: asyncio.create_task(self.aprefetch(search)) for guess, search in self.searches.items()}
+        self.taken = set()
+        for task in self.searches.values():
+            # the searches that are never awaited shouldn't log unretrieved exceptions
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def aprefetch(self, search: asyncio.Task):
+        try:
+            await afetch_articles(top_article_urls([await search]), self.cursor)
+        except Exception as e:
+            logging.info(f"Prefetching articles failed: {e}")
+
+    def take(self, topic: str) -> asyncio.Task | None:
+        """The search of the guess that is the same topic as `topic`, if there is one that isn't taken yet."""
+        for guess in self.searches:
+            if guess not in self.taken and same_topic(guess, topic):
+                self.taken.add(guess)
+                task = asyncio.create_task(self.aresults(guess, topic))
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return task
+        return None
+
+    async def aresults(self, guess: str, topic: str) -> list[dict]:
+        """The results of the search for `guess`, also cached under `topic` so the LM's topic hits next time."""
+        results = await self.searches[guess]
+        if results and guess != topic:
+            remember_search_results(topic, results)
+        return results
+
+    def discard(self):
+        """Cancel the searches (and prefetches) of the guesses that weren't taken."""
+        self.cancel()
+        for guess in self.searches:
+            metrics.record_stage("speculative_search", self.start_time, "used" if guess in self.taken else "discarded")
+        if self.searches:
+            logging.info(f"Speculative search used {len(self.taken)} of {len(self.searches)} guessed topics")
+
+    def cancel(self):
+        """Cancel what wasn't taken, e.g. when the request failed before the topics were extracted."""
+        for guess in self.searches:
+            if guess not in self.taken:
+                self.searches[guess].cancel()
+                self.prefetches[guess].cancel()
+
+
+def build_prompt_context(user_query: str, history: dspy.History, urls: list[str], texts: list[str]) -> PromptContext:
+    """Fit prior turns and article context into CONTEXT_TOKEN_BUDGET.
+
+    Prior turns get up to HISTORY_BUDGET_SHARE of the budget (most recent first), the rest goes to the most
+    relevant passages (or, if PASSAGE_TOP_K is 0, to the full articles, split evenly)."""
+    history, history_used = fit_history(history, int(CONTEXT_TOKEN_BUDGET * HISTORY_BUDGET_SHARE))
+    context_budget = CONTEXT_TOKEN_BUDGET - history_used
+    if PASSAGE_TOP_K > 0:
+        context = top_passages(user_query, urls, texts, k=PASSAGE_TOP_K, max_tokens=context_budget)
+    else:
+        context = fit_articles(texts, context_budget)
+    prompt = PromptContext(
+        context=context,
+        history=history,
+        context_tokens=sum(map(estimate_tokens, context)),
+        history_tokens=history_used,
+    )
+    logging.info(
+        f"Prompt context: {prompt.context_tokens} context + {prompt.history_tokens} history tokens "
+        f"of {CONTEXT_TOKEN_BUDGET} ({len(context)} passages, {len(history.messages)} prior turns)"
+    )
+    return prompt
 
-        return dspy.Prediction(urls=urls, main_topics=topics)
 
 class RadiopaediaQA(dspy.Module):
     def __init__(self, article_finder):
         self.find_articles = article_finder
         self.answer_query = dspy.Predict(AnswerQuerySig)
 
-    def forward(self, user_query: str, history: dspy.History):
-        articles = history.messages[0]["articles"] if history.messages else dict(self.find_articles(user_query=user_query))
+    def forward(self, user_query: str, history: dspy.History, articles: dict = None, context: list[str] = None):
+        if articles is None:
+            articles = history.messages[0]["articles"] if history.messages else dict(self.find_articles(user_query=user_query))
         if not articles["urls"]:
             return dspy.Prediction(error="No results found")
 
-        context = [get_article_text(url=url, cursor=c) for url in articles["urls"]]
+        if context is None:
+            texts = [get_article_text(url=url, cursor=db.cursor()) for url in articles["urls"]]
+            prompt = build_prompt_context(user_query, history, articles["urls"], texts)
+            context, history = prompt.context, prompt.history
         answer = self.answer_query(user_query=user_query, context=context, history=history).answer
         return dspy.Prediction(answer=answer, context=context, articles=articles)
 
+    async def astream_retrieval(self, user_query: str, history: dspy.History):
+        """`aretrieve` with the progress of the article search (first turns only), yields the Retrieval last."""
+        if history.messages:
+            articles = history.messages[0]["articles"]
+        else:
+            async for item in self.find_articles.astream(user_query):
+                if isinstance(item, dspy.Prediction):
+                    articles = dict(item)
+                else:
+                    yield item
+        texts = await afetch_articles(articles["urls"], cursor=db.cursor())
+        yield Retrieval(articles=articles, prompt=build_prompt_context(user_query, history, articles["urls"], texts))
+
+    async def aretrieve(self, user_query: str, history: dspy.History) -> tuple[dict, PromptContext]:
+        """Find the articles for a query, fetch all of them concurrently and fit them into the token budget."""
+        async for item in self.astream_retrieval(user_query, history):
+            retrieval = item
+        return retrieval.articles, retrieval.prompt
+
+    async def aforward(self, user_query: str, history: dspy.History):
+        articles, prompt = await self.aretrieve(user_query, history)
+        if not articles["urls"]:
+            return dspy.Prediction(error="No results found")
+
+        answer = (await self.answer_query.acall(user_query=user_query, context=prompt.context, history=prompt.history)).answer
+        return dspy.Prediction(answer=answer, context=prompt.context, articles=articles)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -186,6 +514,7 @@ http_headers = {
     "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
 }
 
+# created on first use (see warm_up), creating a client loads the TLS certificates
 _http_client = None
 
 def get_http_client():
@@ -194,107 +523,467 @@ def get_http_client():
         _http_client = httpx.Client(timeout=30.0)
     return _http_client
 
-# module level httpx client
-client = get_http_client()
+_async_http_client = None
+
+def get_async_http_client():
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(timeout=30.0)
+    return _async_http_client
+
+def answer_streamer(program: dspy.Module):
+    """`dspy.streamify(program)` streaming the answer field, with a new listener for every call.
+
+    A StreamListener keeps the state of the stream it reads and never resets it, so a shared one stops
+    streaming after the first answer and mixes up the chunks of concurrent answers."""
+
+    def stream(**kwargs):
+        listener = dspy.streaming.StreamListener(signature_field_name="answer")
+        return dspy.streamify(program, stream_listeners=[listener])(**kwargs)
+
+    return stream
+
+
+@dataclass
+class PipelineModules:
+    qa: RadiopaediaQA
+    check_faithfulness: dspy.Module
+    stream_qa: object
+    stream_answer: object
+
+
+class AnswerPipeline:
+    """The DSPy modules behind `aanswer_query`, built once per process and shared by all requests.
+
+    `reload()` rebuilds them (e.g. after a new optimized model was written to OPT_MODEL_PATH) and swaps
+    them in atomically; requests that are already running keep the modules they started with."""
+
+    def __init__(self, opt_model_path: str = None):
+        self.opt_model_path = opt_model_path
+        self._lock = threading.Lock()
+        self.modules = self._build()
+
+    def _build(self) -> PipelineModules:
+        find_articles = RadiopaediaArticleFinder()
+        if self.opt_model_path:
+            find_articles.load(path=self.opt_model_path)
+        qa = RadiopaediaQA(find_articles)
+        checker = dspy.ChainOfThought("context, answer -> is_faithful: bool")
+
+        def check_faithfulness(_, pred):
+            if not pred.context:
+                return 0.0
+            # every failed check makes dspy.Refine retry (until MAX_ANSWER_ATTEMPTS)
+            start_time = time.perf_counter()
+            is_faithful = lm_cache.call("check_faithfulness", checker, context=pred.context, answer=pred.answer).is_faithful
+            metrics.record_stage("faithfulness_check", start_time, "faithful" if is_faithful else "unfaithful")
+            return 1.0 if is_faithful else 0.0
+
+        faithful_qa = dspy.Refine(module=qa, N=MAX_ANSWER_ATTEMPTS, reward_fn=check_faithfulness, threshold=1.0)
+
+        return PipelineModules(
+            qa=qa, check_faithfulness=checker, stream_qa=answer_streamer(faithful_qa), stream_answer=answer_streamer(qa)
+        )
+
+    def reload(self, opt_model_path: str = None):
+        """Rebuild the modules, optionally from a different optimized model file."""
+        with self._lock:
+            if opt_model_path is not None:
+                self.opt_model_path = opt_model_path
+            self.modules = self._build()
+        logging.info(f"Reloaded answer pipeline (optimized model: {self.opt_model_path})")
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline() -> AnswerPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = AnswerPipeline(os.getenv("OPT_MODEL_PATH"))
+    return _pipeline
+
+
+def warm_up():
+    """Do what would otherwise slow down the first requests: open the cache databases (and migrate them),
+    build the pipeline, create the http clients and import sklearn.
+
+    Everything here also happens on first use, so the server can accept requests while this runs."""
+    start_time = time.perf_counter()
+    db.connection()
+    lm_cache.db.connection()
+    get_pipeline()
+    get_http_client()
+    get_async_http_client()
+    query_vectorizer()
+    passage_vectorizer()
+    logging.info(f"Warmed up in {time.perf_counter() - start_time:.2f} s")
+
+
+async def acheck_faithfulness(modules: PipelineModules, context: list[str], answer: str, attempt: int) -> bool | None:
+    """Whether the answer is supported by the context, None if the check itself failed."""
+    start_time = time.perf_counter()
+    try:
+        is_faithful = bool(context) and (
+            await lm_cache.acall("check_faithfulness", modules.check_faithfulness, context=context, answer=answer)
+        ).is_faithful
+    except Exception as e:
+        # the answer has already been sent, a failing check shouldn't turn it into an error
+        logging.warning(f"Faithfulness check {attempt} failed: {e}")
+        metrics.record_stage("faithfulness_check", start_time, "error")
+        return None
+    logging.info(f"Faithfulness check {attempt} took {time.perf_counter() - start_time:.2f} seconds: {is_faithful}")
+    metrics.record_stage("faithfulness_check", start_time, "faithful" if is_faithful else "unfaithful")
+    return is_faithful
+
+
+@dataclass
+class Verification:
+    """Outcome of `averify_answer`: whether the last answer sent passed its faithfulness check."""
+    faithful: bool = False
+
+
+async def averify_answer(
+    modules: PipelineModules,
+    query: str,
+    prompt: PromptContext,
+    answer: str,
+    sources: list[Source],
+    check: asyncio.Task,
+    verification: Verification,
+):
+    """Await the faithfulness check of an answer that has already been sent; regenerate on failure.
+
+    Like dspy.Refine, regenerations use increasing temperatures and the number of attempts (including the
+    first answer) is limited to MAX_ANSWER_ATTEMPTS. Yields a CorrectionEvent for every regenerated answer.
+    The last attempt isn't checked, nothing could replace it. When a check or a regeneration fails, the answer
+    sent last stays."""
+    try:
+        for attempt in range(1, MAX_ANSWER_ATTEMPTS + 1):
+            faithful = await check
+            if faithful is not False or attempt == MAX_ANSWER_ATTEMPTS:
+                verification.faithful = bool(faithful)
+                return
+            start_time = time.perf_counter()
+            temperature = 0.5 + attempt * (0.5 / MAX_ANSWER_ATTEMPTS)
+            try:
+                answer = (await modules.qa.answer_query.acall(
+                    user_query=query, context=prompt.context, history=prompt.history, config={"temperature": temperature}
+                )).answer
+            except Exception as e:
+                logging.warning(f"Regenerating the answer (attempt {attempt + 1}) failed: {e}")
+                metrics.record_stage("retry", start_time, "error")
+                return
+            logging.info(f"Regenerated answer (attempt {attempt + 1}) in {time.perf_counter() - start_time:.2f} seconds")
+            metrics.record_stage("retry", start_time)
+            yield CorrectionEvent(answer=answer, sources=sources)
+            if attempt + 1 == MAX_ANSWER_ATTEMPTS:
+                return
+            check = asyncio.create_task(acheck_faithfulness(modules, prompt.context, answer, attempt + 1))
+    finally:
+        if not check.done():
+            check.cancel()
 
-def structure_search_result(result, idx):
-    return {
-        "id": idx,
-        "title": result.find(class_="search-result-title").text.strip(),
-        "body": result.find(class_="search-result-body").text.strip(),
-        "href": result["href"],
-    }
 
 async def aanswer_query(
     query: str, history: dspy.History
 ):
     """Main coroutine to search and answer questions."""
 
-    find_articles = RadiopaediaArticleFinder()
-    find_articles.load(path=os.getenv("OPT_MODEL_PATH")) if os.getenv("OPT_MODEL_PATH") else None
-    qa = RadiopaediaQA(find_articles)
-
-
-    def check_faithfulness(_, pred):
-        checker = dspy.ChainOfThought("context, answer -> is_faithful: bool")
-        if not pred.context:
-            return 0.0
-        is_faithful = checker(context=pred.context, answer=pred.answer).is_faithful
-        return 1.0 if is_faithful else 0.0
-
-    faithful_qa = dspy.Refine(module=qa, N=3, reward_fn=check_faithfulness, threshold=1.0)
-
-    stream_qa = dspy.streamify(
-        faithful_qa,
-        stream_listeners=[
-            dspy.streaming.StreamListener(signature_field_name="answer")
-        ]
-    )
+    start_time = time.perf_counter()
+    # traced or not as a whole, including the tasks and threads started below
+    sample_request()
+    modules = get_pipeline().modules
+    qa = modules.qa
+    stream_qa = modules.stream_answer if VERIFY_MODE == "concurrent" else modules.stream_qa
+
+    # follow-up answers depend on the conversation, so only first turns are cached
+    cached = answer_cache.get(query) if not history.messages else None
+    if cached is not None:
+        logging.info(f"Answer cache hit for '{query}' (cached for '{cached.query}')")
+        yield FinalAnswerEvent(answer=cached.answer, articles=cached.articles)
+        yield SourcesEvent(sources=[Source(title=url, url=url) for url in list(set(cached.articles["urls"]))], answer=cached.answer)
+        metrics.record_stage("total", start_time, "cached")
+        yield StopEvent()
+        return
 
-    outp_stream = stream_qa(user_query=query, history=history)
     answer = ""
+    check = None
+    verification = Verification()
+    final = None
     try:
+        # retrieval runs on the event loop with the async client, so only the LLM calls go to a worker thread
+        async for event in qa.astream_retrieval(query, history):
+            if isinstance(event, Retrieval):
+                articles, prompt = event.articles, event.prompt
+            else:
+                yield event
+        metrics.record_stage("retrieval", start_time)
+        if not articles["urls"]:
+            yield ErrorEvent(message="No matching Radiopaedia articles found.")
+            metrics.record_stage("total", start_time, "no_articles")
+            yield StopEvent()
+            return
+        generation_start = time.perf_counter()
+        outp_stream = stream_qa(user_query=query, history=prompt.history, articles=articles, context=prompt.context)
         async for chunk in outp_stream:
             if isinstance(chunk, dspy.streaming.StreamResponse):
+                if not answer:
+                    # from the question, the wait the user sees
+                    metrics.record_stage("first_token", start_time)
                 answer += chunk.chunk
                 yield AnswerChunkEvent(answer=answer)
             elif isinstance(chunk, dspy.Prediction):
-                yield FinalAnswerEvent(answer=chunk.answer, articles=chunk.articles)
-                yield SourcesEvent(sources=[Source(title=url, url=url) for url in list(set(chunk.articles["urls"]))], answer=chunk.answer)
+                metrics.record_stage("generation", generation_start)
+                sources = [Source(title=url, url=url) for url in list(set(chunk.articles["urls"]))]
+                if VERIFY_MODE == "concurrent":
+                    # the check runs while the final answer and its sources are sent to the client
+                    check = asyncio.create_task(acheck_faithfulness(modules, prompt.context, chunk.answer, 1))
+                final = FinalAnswerEvent(answer=chunk.answer, articles=chunk.articles)
+                yield final
+                yield SourcesEvent(sources=sources, answer=chunk.answer)
+                if check is not None:
+                    async for event in averify_answer(modules, query, prompt, chunk.answer, sources, check, verification):
+                        final = FinalAnswerEvent(answer=event.answer, articles=chunk.articles)
+                        yield event
+        # in "refine" mode dspy.Refine has checked the answer before it was streamed
+        verified = check is None or verification.faithful
+        if final is not None and verified and not history.messages and answer_cache.max_entries > 0:
+            answer_cache.put(query, final.answer, final.articles)
+        metrics.record_stage("total", start_time, "answered")
         yield StopEvent()
     except Exception as e:
         logging.error(f"Error occurred: {e}")
         yield ErrorEvent(message="Something went wrong. Please try again.")
+        metrics.record_stage("total", start_time, "error")
         yield StopEvent()
+    finally:
+        if check is not None and not check.done():
+            check.cancel()
 
 def search_results(search_term: str, cursor):
-    soup = search_radiopaedia(search_term, cursor)
+    return search_radiopaedia(search_term, cursor)
 
-    all_search_results = [
-        structure_search_result(search_result, i)
-        for i, search_result in enumerate(soup.find_all(class_="search-result"))
-    ]
 
-    return all_search_results
+async def asearch_results(search_term: str, cursor):
+    return await asearch_radiopaedia(search_term, cursor)
 
 
-def get_article_text(url, cursor):
+async def asearch_topics(topics: list[str], cursor, started: dict[str, asyncio.Task] = None):
+    """Search all topics concurrently (at most MAX_PARALLEL_SEARCHES at a time), keeping the order of `topics`.
+
+    Topics in `started` await the search already running for them instead."""
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_SEARCHES)
+    started = started or {}
+
+    async def search(topic):
+        if topic in started:
+            return await started[topic]
+        async with semaphore:
+            return await asearch_results(search_term=topic, cursor=cursor)
+
+    return list(await asyncio.gather(*(search(topic) for topic in topics)))
+
+
+def top_article_urls(results_per_topic: list[list[dict]], n: int = 2):
+    """Top `n` article urls per topic, in topic order and without duplicates."""
+    urls = [
+        f"{RADIOPAEDIA_URL}{r['href']}"
+        for results in results_per_topic
+        for r in results[:n]
+    ]
+    return list(dict.fromkeys(urls))
+
+
+def cached_article_text(url, cursor):
+    content = article_memory.get(url)
+    if content is not None:
+        return content
     cache_hits = cursor.execute(
         "SELECT content FROM radiopaedia_articles WHERE url = ?", (url,)
     ).fetchall()
     if cache_hits:
         logging.info(f"Cache hit for url: '{url}'")
-        return cache_hits[0][0]
-    response = client.get(url, headers=http_headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    content = soup.select("#content > div.body.user-generated-content")[0].text.strip()
+        content = decode_value(cache_hits[0][0])
+        article_memory.put(url, content)
+        return content
+    return None
+
+
+def write_article_text(cursor, url, content):
+    connection = cursor.getconnection()
     cursor.execute(
-        "INSERT INTO radiopaedia_articles (url, content) VALUES (?, ?)", (url, content)
+        "INSERT OR IGNORE INTO radiopaedia_articles (url, content) VALUES (?, ?)", (url, encode_value(content))
     )
+    if connection.changes():
+        index_article(cursor, connection.last_insert_rowid(), url, content)
+
+
+def store_article_text(url, content):
+    # the memory tier serves the article until the queued write is committed
+    article_memory.put(url, content)
+    cache_writes.submit(write_article_text, url, content)
+
+
+# concurrent cache misses for the same url / search query share one upstream request
+article_flights = SingleFlight()
+search_flights = SingleFlight()
+
+
+def get_article_text(url, cursor):
+    start_time = time.perf_counter()
+    content = cached_article_text(url, cursor)
+    if content is not None:
+        metrics.record_stage("article_fetch", start_time, "hit")
+        return content
+    content = article_flights.do(url, fetch_article_text, url, cursor)
+    metrics.record_stage("article_fetch", start_time, "miss")
     return content
 
 
-def search_radiopaedia(search_query: str, cursor):
-    url = "https://radiopaedia.org/search"
+def fetch_article_text(url, cursor):
+    # the previous flight for this url may have filled the cache after our lookup
+    content = cached_article_text(url, cursor)
+    if content is not None:
+        return content
+    response = get_http_client().get(url, headers=http_headers)
+    content = extract_article_text(response.text)
+    store_article_text(url, content)
+    return content
+
+
+async def aget_article_text(url, cursor):
+    start_time = time.perf_counter()
+    content = cached_article_text(url, cursor)
+    if content is not None:
+        metrics.record_stage("article_fetch", start_time, "hit")
+        return content
+    content = await article_flights.ado(url, afetch_article_text, url, cursor)
+    metrics.record_stage("article_fetch", start_time, "miss")
+    return content
+
+
+async def afetch_article_text(url, cursor):
+    content = cached_article_text(url, cursor)
+    if content is not None:
+        return content
+    response = await get_async_http_client().get(url, headers=http_headers)
+    content = extract_article_text(response.text)
+    store_article_text(url, content)
+    return content
+
+
+async def afetch_articles(urls: list[str], cursor):
+    """Fetch the text of all urls concurrently, keeping the order of `urls`."""
+    return list(await asyncio.gather(*(aget_article_text(url, cursor) for url in urls)))
+
+
+search_url = f"{RADIOPAEDIA_URL}/search"
+
+
+def search_params(search_query: str):
+    return {"lang": "us", "q": search_query, "scope": "articles"}
+
+
+def cached_search_results(search_query: str, cursor):
+    results = search_memory.get(search_query)
+    if results is not None:
+        return results
     cache_hits = cursor.execute(
         "SELECT search_results FROM radiopaedia_search_results WHERE search_query = ?",
         (search_query,),
     ).fetchall()
     if cache_hits:
         logging.info(f"Cache hit for search query: '{search_query}'")
-        rbody = cache_hits[0][0]
-        return BeautifulSoup(rbody, "html.parser")
+        payload = decode_value(cache_hits[0][0])
+        results = load_search_results(payload)
+        search_memory.put(search_query, results, size=len(payload))
+        return results
+    return None
 
-    params = {"lang": "us", "q": search_query, "scope": "articles"}
 
-    response = client.get(url, params=params, headers=http_headers)
+def write_search_results(cursor, search_query: str, payload: str):
+    cursor.execute(
+        "INSERT OR IGNORE INTO radiopaedia_search_results (search_query, search_results) VALUES (?, ?)",
+        (search_query, encode_value(payload)),
+    )
 
-    soup = BeautifulSoup(response.text, "html.parser")
 
-    if soup.find(class_="search-result"):
-        cursor.execute(
-            "INSERT INTO radiopaedia_search_results (search_query, search_results) VALUES (?, ?)",
-            (search_query, response.content),
-        )
+def store_search_results(search_query: str, response: httpx.Response):
+    results = extract_search_results(response.text)
+    if results:
+        remember_search_results(search_query, results)
+    return results
+
 
-    return BeautifulSoup(response.text, "html.parser")
+def remember_search_results(search_query: str, results: list[dict]):
+    payload = dump_search_results(results)
+    search_memory.put(search_query, results, size=len(payload))
+    cache_writes.submit(write_search_results, search_query, payload)
+
+
+def local_search_results(search_query: str, cursor, limit: int = 10):
+    """Search results from the full-text index over cached articles, in the shape of `search_results`.
+
+    Returns None when SEARCH_MODE is "network", or in "local_first" mode when the index has too few hits or
+    the best hit's title doesn't match the query, so the caller falls back to radiopaedia.org."""
+    if SEARCH_MODE == "network":
+        return None
+    hits = search_index(search_query, cursor, limit=limit)
+    results = [
+        {"id": i, "title": article_title(url), "body": decode_value(content, max_chars=300), "href": url.removeprefix(RADIOPAEDIA_URL)}
+        for i, (url, content) in enumerate(hits)
+    ]
+    enough = bool(results) and len(results) >= LOCAL_SEARCH_MIN_RESULTS and title_matches(search_query, results[0]["title"])
+    if SEARCH_MODE == "local" or enough:
+        logging.info(f"Local search for '{search_query}' found {len(results)} articles")
+        return results
+    return None
+
+
+def search_radiopaedia(search_query: str, cursor):
+    start_time = time.perf_counter()
+    results = cached_search_results(search_query, cursor)
+    if results is not None:
+        metrics.record_stage("search", start_time, "hit")
+        return results
+    results = local_search_results(search_query, cursor)
+    if results is not None:
+        metrics.record_stage("search", start_time, "local")
+        return results
+    results = search_flights.do(search_query, fetch_search_results, search_query, cursor)
+    metrics.record_stage("search", start_time, "miss")
+    return results
+
+
+def fetch_search_results(search_query: str, cursor):
+    results = cached_search_results(search_query, cursor)
+    if results is not None:
+        return results
+    response = get_http_client().get(search_url, params=search_params(search_query), headers=http_headers)
+    return store_search_results(search_query, response)
+
+
+async def asearch_radiopaedia(search_query: str, cursor):
+    start_time = time.perf_counter()
+    results = cached_search_results(search_query, cursor)
+    if results is not None:
+        metrics.record_stage("search", start_time, "hit")
+        return results
+    results = local_search_results(search_query, cursor)
+    if results is not None:
+        metrics.record_stage("search", start_time, "local")
+        return results
+    results = await search_flights.ado(search_query, afetch_search_results, search_query, cursor)
+    metrics.record_stage("search", start_time, "miss")
+    return results
+
+
+async def afetch_search_results(search_query: str, cursor):
+    results = cached_search_results(search_query, cursor)
+    if results is not None:
+        return results
+    response = await get_async_http_client().get(search_url, params=search_params(search_query), headers=http_headers)
+    return store_search_results(search_query, response)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import dspy
+
+from .db import Database, WriteBehind
+
+
+class LMCache:
+    """On-disk cache of predictor outputs, shared by all workers using the same sqlite file.
+
+    Entries are keyed by model, predictor name, signature (instructions and fields), demos and inputs, so
+    loading a new optimized program or switching models never returns stale outputs. Only predictors listed
+    in `predictors` are cached. Entries expire after `ttl` seconds and the oldest entries are evicted beyond
+    `max_entries`.
+
+    New entries and evictions are written by a background thread (see `WriteBehind`), so a call never waits
+    for the write lock another worker holds; entries that aren't committed yet are served from memory."""
+
+    def __init__(self, db_path: str, predictors: set[str], max_entries: int = 100_000, ttl: float = 30 * 24 * 3600):
+        self.predictors = predictors
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db = Database(db_path, setup=self._setup)
+        self.writes = WriteBehind(self.db)
+        self._lock = threading.Lock()
+        # key -> outputs as json, for puts that aren't committed yet
+        self._pending: dict[str, str] = {}
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _setup(cursor):
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS lm_cache (key TEXT PRIMARY KEY, predictor TEXT, outputs TEXT, created_at REAL)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS lm_cache_created_at ON lm_cache (created_at)")
+
+    def key(self, name: str, module: dspy.Module, model: str, inputs: dict) -> str:
+        predictors = [
+            {"signature": f"{p.signature.instructions}\n{p.signature}", "demos": p.demos}
+            for _, p in module.named_predictors()
+        ]
+        payload = json.dumps([model, name, predictors, inputs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _write(cursor, key: str, name: str, outputs: str, created_at: float):
+        cursor.execute(
+            "INSERT OR REPLACE INTO lm_cache (key, predictor, outputs, created_at) VALUES (?, ?, ?, ?)",
+            (key, name, outputs, created_at),
+        )
+
+    @staticmethod
+    def _evict(cursor, max_entries: int, ttl: float) -> int:
+        cursor.execute("DELETE FROM lm_cache WHERE created_at <= ?", (time.time() - ttl,))
+        expired = cursor.connection.changes()
+        cursor.execute(
+            "DELETE FROM lm_cache WHERE key IN (SELECT key FROM lm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (max_entries,),
+        )
+        return expired + cursor.connection.changes()
+
+    def _committed(self, key: str, outputs: str):
+        with self._lock:
+            if self._pending.get(key) is outputs:
+                del self._pending[key]
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            outputs = self._pending.get(key)
+        if outputs is None:
+            rows = self.db.execute(
+                "SELECT outputs FROM lm_cache WHERE key = ? AND created_at > ?", (key, time.time() - self.ttl)
+            ).fetchall()
+            outputs = rows[0][0] if rows else None
+        return json.loads(outputs) if outputs is not None else None
+
+    def put(self, key: str, name: str, outputs: dict):
+        outputs = json.dumps(outputs)
+        with self._lock:
+            self._pending[key] = outputs
+            self._puts += 1
+            evict = self._puts % 100 == 0
+        self.writes.submit(self._write, key, name, outputs, time.time(), committed=lambda: self._committed(key, outputs))
+        if evict:
+            self.writes.submit(self._evict, self.max_entries, self.ttl)
+
+    def evict(self) -> int:
+        """Drop expired entries and the oldest entries beyond `max_entries`, returns the number dropped."""
+        self.writes.flush()
+        connection = self.db.connection()
+        with connection:
+            return self._evict(connection.cursor(), self.max_entries, self.ttl)
+
+    def close(self):
+        """Commit the queued writes, e.g. on shutdown."""
+        self.writes.close()
+
+    def clear(self, predictor: str = None):
+        self.writes.flush()
+        if predictor is None:
+            self.db.execute("DELETE FROM lm_cache")
+        else:
+            self.db.execute("DELETE FROM lm_cache WHERE predictor = ?", (predictor,))
+
+    def _lookup(self, name: str, module: dspy.Module, inputs: dict):
+        if name not in self.predictors:
+            return None, None
+        lm = module.get_lm() or dspy.settings.lm
+        key = self.key(name, module, getattr(lm, "model", str(lm)), inputs)
+        outputs = self.get(key)
+        if outputs is not None:
+            self.hits += 1
+            logging.info(f"LM cache hit for {name}")
+        else:
+            self.misses += 1
+        return key, outputs
+
+    def _store(self, key: str, name: str, module: dspy.Module, prediction: dspy.Prediction):
+        if key is not None:
+            output_fields = [f for _, p in module.named_predictors() for f in p.signature.output_fields]
+            self.put(key, name, {f: prediction[f] for f in output_fields})
+
+    def _cached_prediction(self, module: dspy.Module, inputs: dict, outputs: dict) -> dspy.Prediction:
+        prediction = dspy.Prediction(**outputs)
+        # record the call like Predict does, so optimizers still see cached calls in their traces
+        if dspy.settings.trace is not None:
+            for _, predictor in module.named_predictors():
+                dspy.settings.trace.append((predictor, inputs, prediction))
+        return prediction
+
+    def call(self, name: str, module: dspy.Module, **inputs) -> dspy.Prediction:
+        """`module(**inputs)`, served from the cache if `name` is an opted-in predictor."""
+        key, outputs = self._lookup(name, module, inputs)
+        if outputs is not None:
+            return self._cached_prediction(module, inputs, outputs)
+        prediction = module(**inputs)
+        self._store(key, name, module, prediction)
+        return prediction
+
+    async def acall(self, name: str, module: dspy.Module, **inputs) -> dspy.Prediction:
+        key, outputs = self._lookup(name, module, inputs)
+        if outputs is not None:
+            return self._cached_prediction(module, inputs, outputs)
+        prediction = await module.acall(**inputs)
+        self._store(key, name, module, prediction)
+        return prediction
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
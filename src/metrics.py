@@ -0,0 +1,138 @@
+import bisect
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Stage latencies and counters of this process, rendered in the Prometheus text format for /metrics.
+# Every uvicorn worker keeps its own, so scrape each worker (or run one worker per instance).
+
+# seconds, from a memory cache hit up to a slow LM generation
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Family:
+    """One metric with its samples: (name suffix, labels, value)."""
+
+    name: str
+    kind: str
+    help: str
+    samples: list[tuple[str, dict, float]] = field(default_factory=list)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> (observations per bucket, not cumulative; the last one is +Inf), sum
+        self._values: dict[tuple, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def counts(self, **labels) -> dict[tuple, int]:
+        """Number of observations per label set, of those matching `labels`."""
+        with self._lock:
+            items = [(key, sum(counts)) for key, (counts, _) in self._values.items()]
+        return {
+            key: n
+            for key, n in items
+            if all(key[self.labelnames.index(name)] == value for name, value in labels.items())
+        }
+
+    def collect(self) -> list[Family]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                samples.append(("_bucket", {**labels, "le": format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return [Family(self.name, "histogram", self.help, samples)]
+
+
+_metrics: list = []
+_collectors: list[Callable[[], list[Family]]] = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], list[Family]]):
+    """Add a function that reports values it reads at scrape time, e.g. from the `stats()` of a cache."""
+    _collectors.append(collector)
+    return collector
+
+
+def gauge(name: str, help: str, samples: list[tuple[dict, float]]) -> Family:
+    return Family(name, "gauge", help, [("", labels, value) for labels, value in samples])
+
+
+def counter(name: str, help: str, samples: list[tuple[dict, float]]) -> Family:
+    return Family(name, "counter", help, [("_total", labels, value) for labels, value in samples])
+
+
+STAGE_SECONDS = register(
+    Histogram(
+        "wilhelm_stage_duration_seconds",
+        "Duration of the stages of answering a query, by stage and result (e.g. cache hit or miss).",
+        ("stage", "result"),
+    )
+)
+
+
+def record_stage(stage: str, start_time: float, result: str = "ok"):
+    """Observe the time since `start_time` (from `time.perf_counter()`) for `stage`."""
+    STAGE_SECONDS.observe(time.perf_counter() - start_time, stage=stage, result=result)
+
+
+def hit_ratio(stage: str, hits: tuple[str, ...] = ("hit",)) -> float:
+    """Share of the observations of `stage` with one of the results in `hits`, NaN before the first one."""
+    counts = STAGE_SECONDS.counts(stage=stage)
+    total = sum(counts.values())
+    if not total:
+        return float("nan")
+    return sum(n for (_, result), n in counts.items() if result in hits) / total
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value != value:
+        return "NaN"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    families = [family for metric in _metrics for family in metric.collect()]
+    for collector in _collectors:
+        families.extend(collector())
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for suffix, labels, value in family.samples:
+            label_text = ",".join(f'{name}="{escape(v)}"' for name, v in labels.items())
+            name = f"{family.name}{suffix}{{{label_text}}}" if labels else f"{family.name}{suffix}"
+            lines.append(f"{name} {format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,90 @@
+import re
+from functools import cache
+
+from .budget import estimate_tokens
+from .cache import LRUCache
+
+
+@cache
+def vectorizer():
+    """Term count vectorizer of passages and queries, created (and sklearn imported) on first use."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    # Hashed term counts need no fitted vocabulary, so the vectors of an article can be cached on their own
+    # and only the (cheap) idf weighting is fitted per query over the candidate passages.
+    return HashingVectorizer(n_features=2**18, ngram_range=(1, 2), stop_words="english", alternate_sign=False, norm=None)
+
+# url -> (passages, term count matrix)
+passage_memory = LRUCache(max_entries=512, max_bytes=64 * 1024 * 1024)
+
+
+def chunk_text(text: str, max_words: int = 150) -> list[str]:
+    """Split an article into passages of at most about `max_words` words.
+
+    Paragraphs are merged until a passage is full (so headings stay with the paragraph that follows them),
+    paragraphs longer than a passage are split at sentence boundaries."""
+    paragraphs = [p.strip() for p in re.split(r"\n+", text) if p.strip()]
+    pieces = []
+    for paragraph in paragraphs:
+        if len(paragraph.split()) <= max_words:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(re.split(r"(?<=[.!?])\s+", paragraph))
+
+    passages, current, current_words = [], [], 0
+    for piece in pieces:
+        words = len(piece.split())
+        if current and current_words + words > max_words:
+            passages.append("\n".join(current))
+            current, current_words = [], 0
+        current.append(piece)
+        current_words += words
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def article_passages(url: str, text: str):
+    """Passages and their term count vectors for an article, cached per url."""
+    cached = passage_memory.get(url)
+    if cached is not None:
+        return cached
+    passages = chunk_text(text)
+    counts = vectorizer().transform(passages)
+    size = len(text) + counts.data.nbytes + counts.indices.nbytes + counts.indptr.nbytes
+    passage_memory.put(url, (passages, counts), size=size)
+    return passages, counts
+
+
+def top_passages(query: str, urls: list[str], texts: list[str], k: int = 8, max_tokens: int = None) -> list[str]:
+    """The `k` passages of the articles most relevant to `query` (TF-IDF cosine similarity).
+
+    With `max_tokens`, lower ranked passages that don't fit into the remaining budget are skipped. Passages are
+    returned in article order and in their order within the article, so the context still reads like the source."""
+    candidates, matrices = [], []
+    for url, text in zip(urls, texts):
+        passages, counts = article_passages(url, text)
+        candidates.extend(passages)
+        matrices.append(counts)
+    if len(candidates) <= k and (max_tokens is None or sum(map(estimate_tokens, candidates)) <= max_tokens):
+        return candidates
+
+    from scipy.sparse import vstack
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.metrics.pairwise import linear_kernel
+
+    tfidf = TfidfTransformer()
+    passage_vectors = tfidf.fit_transform(vstack(matrices))
+    query_vector = tfidf.transform(vectorizer().transform([query]))
+    scores = linear_kernel(query_vector, passage_vectors).ravel()
+
+    best, used = [], 0
+    for i in scores.argsort()[::-1]:
+        tokens = estimate_tokens(candidates[i])
+        if max_tokens is not None and used + tokens > max_tokens:
+            continue
+        best.append(i)
+        used += tokens
+        if len(best) == k:
+            break
+    return [candidates[i] for i in sorted(best)]
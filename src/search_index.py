@@ -0,0 +1,78 @@
+import re
+from urllib.parse import urlparse
+
+# Full-text index over the cached articles. The table is contentless (the text lives in
+# radiopaedia_articles), its rowids are the rowids of radiopaedia_articles.
+FTS_TABLE = "radiopaedia_articles_fts"
+
+# title matches weigh ten times as much as matches in the article body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+
+def setup_search_index(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, content, content='', contentless_delete=1, tokenize='porter unicode61')"
+    )
+
+
+def article_title(url: str) -> str:
+    """Radiopaedia article urls end in the slugified title, e.g. /articles/hepatic-adenoma?lang=us."""
+    slug = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+    return slug.replace("-", " ")
+
+
+def index_article(cursor, rowid: int, url: str, content: str):
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (?, ?, ?)",
+        (rowid, article_title(url), content),
+    )
+
+
+def rebuild_search_index(cursor, load_content=lambda content: content):
+    """Index every cached article from scratch, returns the number of indexed articles."""
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    rows = cursor.execute("SELECT rowid, url, content FROM radiopaedia_articles").fetchall()
+    for rowid, url, content in rows:
+        index_article(cursor, rowid, url, load_content(content))
+    return len(rows)
+
+
+def query_terms(search_query: str) -> list[str]:
+    return re.findall(r"\w+", search_query.lower())
+
+
+def singular(word: str) -> str:
+    """`word` without a plural ending: "adenomas", "abscesses", "arteries" and "vertebrae" lose theirs, while
+    "stenosis" or "sinus" are left alone. Nothing else is stemmed, "meningioma" and "meningitis" stay apart."""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("omata"):
+        return word[:-2]
+    if word.endswith("ae") and len(word) > 3:
+        return word[:-1]
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def title_matches(search_query: str, title: str) -> bool:
+    """Whether every term of the query occurs in the title (up to plurals)."""
+    title_words = {singular(word) for word in query_terms(title)}
+    return all(singular(term) in title_words for term in query_terms(search_query))
+
+
+def search_index(search_query: str, cursor, limit: int = 10) -> list[tuple[str, str]]:
+    """BM25-ranked (url, content) pairs of the cached articles matching all terms of the query."""
+    terms = query_terms(search_query)
+    if not terms:
+        return []
+    match = " ".join(f'"{term}"' for term in terms)
+    return cursor.execute(
+        f"SELECT a.url, a.content FROM {FTS_TABLE} JOIN radiopaedia_articles a ON a.rowid = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH ? ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) LIMIT ?",
+        (match, limit),
+    ).fetchall()
@@ -0,0 +1,81 @@
+import re
+
+import mistletoe
+from fasthtml.common import Div, NotStr, sse_message
+
+LIST_ITEM = re.compile(r"(?:[-*+]|\d{1,9}[.)])(?:\s|$)")
+FENCE = re.compile(r" {0,3}(`{3,}|~{3,})")
+
+
+def block_kind(line: str) -> str:
+    if LIST_ITEM.match(line):
+        return "list"
+    if line.startswith(">"):
+        return "quote"
+    return "other"
+
+
+def stable_blocks_end(text: str, start: int = 0) -> int:
+    """Index up to which the markdown blocks of `text` can no longer change, searching from the block boundary
+    `start` on.
+
+    A blank line ends a block unless a fenced code block is open, the next line is indented (it could continue
+    the block above) or the next block continues the list or quote above. Rendering the text up to the
+    returned index and the rest separately gives the same HTML as rendering all of it."""
+    end, position, fence, blank, kind = start, start, None, False, None
+    # the last line may still grow ("1" can become "1. item"), so it never decides a boundary
+    for line in text[start:].split("\n")[:-1]:
+        match = FENCE.match(line)
+        if fence is not None:
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) and not line.strip(" `~"):
+                fence = None
+        elif not line.strip():
+            blank = True
+        else:
+            if kind is None:
+                kind = block_kind(line)
+            elif blank and not line[0].isspace():
+                next_kind = block_kind(line)
+                if next_kind == "other" or next_kind != kind:
+                    end = position
+                kind = next_kind
+            blank = False
+            if match:
+                fence = match.group(1)
+        position += len(line) + 1
+    return end
+
+
+class IncrementalAnswer:
+    """SSE frames for an answer that is streamed as ever longer markdown text.
+
+    The first frame swaps in the answer with two targets: completed blocks are rendered once and appended to
+    the first, only the unfinished last block is re-rendered and replaces the content of the second. Rendering
+    cost and bytes on the wire grow with the answer length instead of its square."""
+
+    def __init__(self):
+        self.stable = 0
+        self.tail = None
+
+    def frame(self, answer: str) -> str:
+        end = stable_blocks_end(answer, self.stable)
+        blocks = mistletoe.markdown(answer[self.stable : end]) if end > self.stable else ""
+        tail = mistletoe.markdown(answer[end:])
+        first = self.tail is None
+        self.stable = end
+
+        if first:
+            self.tail = tail
+            return sse_message(
+                Div(id="content", cls="prose")(
+                    Div(sse_swap="answer-blocks", hx_swap="beforeend")(NotStr(blocks)),
+                    Div(sse_swap="answer-tail")(NotStr(tail)),
+                )
+            )
+        frames = ""
+        if blocks:
+            frames += sse_message(NotStr(blocks), event="answer-blocks")
+        if blocks or tail != self.tail:
+            frames += sse_message(NotStr(tail), event="answer-tail")
+        self.tail = tail
+        return frames
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import random
+from contextvars import ContextVar
+from pathlib import Path
+
+# "server": traces go to the MLflow tracking server at MLFLOW_TRACKING_URI
+# "file": traces go to a local mlruns directory (TRACE_FILE_DIR), view them with `mlflow ui --backend-store-uri <dir>`
+# "off": no tracing
+TRACING_MODE = os.getenv("TRACING_MODE", "server")
+# share of requests that are traced (with all their spans), the others skip MLflow entirely
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# traces are exported by background threads; when the queue is full (e.g. the server is down) new traces are
+# dropped instead of slowing down requests
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+TRACE_EXPORT_WORKERS = int(os.getenv("TRACE_EXPORT_WORKERS", "2"))
+TRACE_EXPORT_TIMEOUT = int(os.getenv("TRACE_EXPORT_TIMEOUT", "30"))
+TRACE_FILE_DIR = os.getenv("TRACE_FILE_DIR", "data/mlruns")
+
+
+# whether the request running in this context is traced; set per request by `sample_request`
+_sampled: ContextVar[bool] = ContextVar("trace_sampled", default=True)
+
+
+def sample_request() -> bool:
+    """Decide whether the current request is traced, for everything it runs (tasks and threads copy the context)."""
+    sampled = TRACE_SAMPLE_RATE >= 1 or random.random() < TRACE_SAMPLE_RATE
+    _sampled.set(sampled)
+    return sampled
+
+
+def sampled_callback(callback_class: type) -> type:
+    """A subclass of the DSPy callback `callback_class` that ignores the calls of requests that aren't sampled.
+
+    MLflow's own sampler can't be used: it decides per root span, and the children of a dropped span start
+    traces of their own, so sampled requests end up as fragments."""
+
+    def hook(name):
+        def call(self, *args, **kwargs):
+            if _sampled.get():
+                return getattr(super(cls, self), name)(*args, **kwargs)
+
+        return call
+
+    hooks = {name: hook(name) for name in dir(callback_class) if name.startswith("on_")}
+    cls = type(f"Sampled{callback_class.__name__}", (callback_class,), hooks)
+    return cls
+
+
+def tracking_uri(mode: str) -> str:
+    if mode == "file":
+        return Path(TRACE_FILE_DIR).resolve().as_uri()
+    return os.getenv("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000")
+
+
+def tracing_wanted(mode: str, sample_rate: float) -> bool:
+    if mode not in ("server", "file", "off"):
+        raise ValueError(f"unknown tracing mode {mode!r}")
+    if mode == "off" or sample_rate <= 0:
+        logging.info("MLflow tracing is off")
+        return False
+
+    # read by MLflow when it sets up the export queue
+    os.environ.setdefault("MLFLOW_ENABLE_ASYNC_TRACE_LOGGING", "true")
+    os.environ.setdefault("MLFLOW_ASYNC_TRACE_LOGGING_MAX_QUEUE_SIZE", str(TRACE_QUEUE_SIZE))
+    os.environ.setdefault("MLFLOW_ASYNC_TRACE_LOGGING_MAX_WORKERS", str(TRACE_EXPORT_WORKERS))
+    os.environ.setdefault("MLFLOW_ASYNC_TRACE_LOGGING_RETRY_TIMEOUT", str(TRACE_EXPORT_TIMEOUT))
+    return True
+
+
+def connect_tracking(mode: str) -> str | None:
+    """Import MLflow and set the experiment (a request to the tracking server), returns the tracking URI or None."""
+    import mlflow
+
+    uri = tracking_uri(mode)
+    try:
+        mlflow.set_tracking_uri(uri)
+        mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "wilhelmai-dev"))
+    except Exception as e:
+        # an unreachable tracking server shouldn't keep the app from serving
+        logging.warning(f"MLflow tracing is off, the tracking server at {uri} is not available: {e}")
+        return None
+    return uri
+
+
+def enable_autolog():
+    """Add MLflow's DSPy callback, sampled per request. Only the thread that configured DSPy may call this."""
+    import dspy
+    import mlflow
+    from mlflow.dspy.callback import MlflowCallback
+
+    mlflow.dspy.autolog()
+    Sampled = sampled_callback(MlflowCallback)
+    dspy.settings.configure(
+        callbacks=[Sampled() if type(c) is MlflowCallback else c for c in dspy.settings.callbacks]
+    )
+    # the tracer is (re)built with the export settings above on the next trace
+    mlflow.tracing.reset()
+
+
+async def start_tracing(mode: str = None, sample_rate: float = None) -> bool:
+    """Trace the DSPy pipeline with MLflow as configured, returns whether tracing is on.
+
+    MLflow is imported and the tracking server contacted in a worker thread, so a server can serve (untraced)
+    requests in the meantime. Await it on the event loop of the thread that configured DSPy, autologging is
+    switched on there. Explicitly set MLFLOW_ASYNC_TRACE_LOGGING_* variables take precedence over the settings here."""
+    mode = mode or TRACING_MODE
+    sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if not tracing_wanted(mode, sample_rate):
+        return False
+    uri = await asyncio.to_thread(connect_tracking, mode)
+    if uri is None:
+        return False
+    enable_autolog()
+    logging.info(f"MLflow tracing of {sample_rate:.0%} of requests to {uri}")
+    return True
@@ -1,6 +1,8 @@
 import asyncio
 import mistletoe
 import logging
+import os
+import time
 
 from .lib import (
     LogicEvent,
@@ -11,34 +13,52 @@ from .lib import (
     AnswerChunkEvent,
     FinalAnswerEvent,
     SourcesEvent,
+    CorrectionEvent,
     aanswer_query,
     ConversationManager,
 )
 
 from .components import SourceComponent
+from .streaming import IncrementalAnswer
 
 from fasthtml.common import Div, Span, NotStr, sse_message
 
+# "incremental": answer chunks only send newly completed markdown blocks and the re-rendered last block
+# "full": every answer chunk re-renders and sends the whole answer so far
+SSE_RENDER_MODE = os.getenv("SSE_RENDER_MODE", "incremental")
+# answer chunks are coalesced into one frame per STREAM_FLUSH_MS milliseconds or STREAM_FLUSH_CHARS new characters
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "400"))
 
-def event_to_sse(event: LogicEvent):
+
+def answer_with_sources(answer: str, sources: list, note: str = None):
+    return (
+        Div(id="content", cls="prose")(NotStr(mistletoe.markdown(answer))),
+        Div(cls="mt-4 text-xs text-zinc-400")(
+            Div(
+                Span("Sources", cls="block mb-1"),
+                Div(cls="flex flex-wrap gap-2")(
+                    *[SourceComponent(source) for source in sources],
+                ),
+            )
+        ),
+        *([Div(cls="mt-2 text-xs text-zinc-400")(note)] if note else []),
+    )
+
+
+def event_to_sse(event: LogicEvent, renderer: IncrementalAnswer = None):
     match event:
+        case AnswerChunkEvent(answer) if renderer is not None:
+            return renderer.frame(answer)
         case AnswerChunkEvent(answer) | FinalAnswerEvent(answer):
             return sse_message(
                 Div(id="content", cls="prose")(NotStr(mistletoe.markdown(answer)))
             )
         case SourcesEvent(sources, answer):
+            return sse_message(answer_with_sources(answer, sources))
+        case CorrectionEvent(answer, sources):
             return sse_message(
-                (
-                    Div(id="content", cls="prose")(NotStr(mistletoe.markdown(answer))),
-                    Div(cls="mt-4 text-xs text-zinc-400")(
-                        Div(
-                            Span("Sources", cls="block mb-1"),
-                            Div(cls="flex flex-wrap gap-2")(
-                                *[SourceComponent(source) for source in sources],
-                            ),
-                        )
-                    ),
-                )
+                answer_with_sources(answer, sources, note="This answer was revised because the first version was not fully supported by the sources.")
             )
         case SearchEvent(terms):
             return sse_message(
@@ -58,26 +78,61 @@ def event_to_sse(event: LogicEvent):
             return "event: close\ndata: \n\n"
 
 
+async def forward_events(events, queue: asyncio.Queue):
+    """Put the events of the async iterator `events` into `queue`, then None."""
+    try:
+        async for event in events:
+            await queue.put(event)
+    finally:
+        await queue.put(None)
+
+
 async def answer_query_sse(query: str, conv_id: str, conversation_manager: ConversationManager):
     """This function consumes the events from the answer_query generator and yields SSE messages with HTML in it."""
     start_time = asyncio.get_event_loop().time()
 
     _, history = conversation_manager.get_or_create_conversation(conv_id)
+    renderer = IncrementalAnswer() if SSE_RENDER_MODE == "incremental" else None
+    pending, sent_at, sent_chars = None, 0.0, 0
 
-    async for event in aanswer_query(query, history):
-        yield event_to_sse(event)
-        if isinstance(event, FinalAnswerEvent):
-            history.messages.append(
-                {
-                    "user_query": query,
-                    "answer": event.answer,
-                    "articles": event.articles,
-                }
-            )
-            conversation_manager.update_conversation(conv_id, history)
-        if isinstance(event, StopEvent):
-            end_time = asyncio.get_event_loop().time()
-            logging.info(f"answered query in {end_time - start_time:.2f} seconds")
-            return
-
-
+    # the answer runs in a task of its own (keeping its context variables in one task), so coalesced chunks
+    # can be sent when the LM pauses instead of waiting for its next event
+    queue = asyncio.Queue()
+    producer = asyncio.create_task(forward_events(aanswer_query(query, history), queue))
+    try:
+        while True:
+            if pending is not None:
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(0.0, sent_at + STREAM_FLUSH_MS / 1000 - time.monotonic()))
+                except asyncio.TimeoutError:
+                    yield event_to_sse(pending, renderer)
+                    pending, sent_at, sent_chars = None, time.monotonic(), len(pending.answer)
+                    continue
+            else:
+                event = await queue.get()
+            if event is None:
+                # raises if the answer failed without a StopEvent
+                await producer
+                return
+            if isinstance(event, AnswerChunkEvent):
+                # every chunk carries the whole answer so far, so only the latest one of a burst needs sending
+                now = time.monotonic()
+                if (now - sent_at) * 1000 < STREAM_FLUSH_MS and len(event.answer) - sent_chars < STREAM_FLUSH_CHARS:
+                    pending = event
+                    continue
+                pending, sent_at, sent_chars = None, now, len(event.answer)
+            elif pending is not None and not isinstance(event, FinalAnswerEvent):
+                yield event_to_sse(pending, renderer)
+                pending = None
+            yield event_to_sse(event, renderer)
+            if isinstance(event, FinalAnswerEvent):
+                conversation_manager.add_turn(conv_id, history, query, event.answer, event.articles)
+            if isinstance(event, CorrectionEvent) and history.messages:
+                history.messages[-1]["answer"] = event.answer
+                conversation_manager.update_conversation(conv_id, history)
+            if isinstance(event, StopEvent):
+                end_time = asyncio.get_event_loop().time()
+                logging.info(f"answered query in {end_time - start_time:.2f} seconds")
+                return
+    finally:
+        producer.cancel()
@@ -0,0 +1,70 @@
+from src.answer_cache import AnswerCache
+
+import time
+
+
+def test_answer_cache_near_duplicate_lookup():
+    # arrange
+    cache = AnswerCache(threshold=0.8)
+    cache.put("How do I measure the TT-TG distance on CT?", "Like this.", {"urls": []})
+
+    # act / assert
+    assert cache.get("how do i measure the TT-TG distance on CT").answer == "Like this."
+    assert cache.get("how do I measure the TT TG distance in CT?").answer == "Like this."
+    assert cache.get("What is a meningioma?") is None
+    assert cache.stats() == {"hits": 1, "near_hits": 1, "misses": 1, "entries": 1}
+
+
+def test_answer_cache_requires_matching_numbers():
+    cache = AnswerCache(threshold=0.8)
+    cache.put("How do I recognize a type 1 endoleak on CTA?", "Type 1.", {"urls": []})
+
+    assert cache.get("How do I recognize a type 2 endoleak on CTA?") is None
+
+
+def test_answer_cache_requires_matching_roman_numerals_and_grades():
+    # arrange
+    cache = AnswerCache(threshold=0.8)
+    cache.put("What is a Salter-Harris type IV fracture?", "Type IV.", {"urls": []})
+    cache.put("How do I recognize type II endoleaks?", "Type II.", {"urls": []})
+    cache.put("What is a Bosniak IIF cyst?", "IIF.", {"urls": []})
+    cache.put("How does hepatitis B look on ultrasound?", "B.", {"urls": []})
+
+    # act / assert
+    assert cache.get("What is a Salter-Harris type II fracture?") is None
+    assert cache.get("How do I recognize type III endoleaks?") is None
+    assert cache.get("What is a Bosniak II cyst?") is None
+    assert cache.get("How does hepatitis C look on ultrasound?") is None
+    assert cache.get("what is a salter harris type IV fracture").answer == "Type IV."
+
+
+def test_answer_cache_requires_matching_content_words():
+    # arrange
+    cache = AnswerCache(threshold=0.8)
+    cache.put("How to differentiate between a hepatic adenoma and focal nodular hyperplasia on CT?", "CT.", {"urls": []})
+    cache.put("What are the imaging features of hepatocellular carcinoma in a young woman?", "HCC.", {"urls": []})
+    cache.put("What are the imaging findings of right sided appendicitis?", "Right.", {"urls": []})
+    cache.put("How do osteoporotic compression fractures of the spine look on CT?", "CT.", {"urls": []})
+
+    # act / assert
+    assert cache.get("how to differentiate between a hepatic adenoma and focal nodular hyperplasia on MRI?") is None
+    assert cache.get("What are the imaging features of hepatocellular adenoma in a young woman?") is None
+    assert cache.get("What are the imaging findings of left sided appendicitis?") is None
+    assert cache.get("How do osteoporotic compression fractures of the spine look on MRI?") is None
+    assert cache.get("how do osteoporotic compresion fractures of the spine look on CT").answer == "CT."
+
+
+def test_answer_cache_ttl_and_size_eviction(monkeypatch):
+    # arrange
+    cache = AnswerCache(max_entries=2, ttl=60)
+    now = time.time()
+    cache.put("first question", "1", {"urls": []})
+    cache.put("second question", "2", {"urls": []})
+    cache.put("third question", "3", {"urls": []})
+
+    # act / assert
+    assert len(cache) == 2
+    assert cache.get("first question") is None
+    monkeypatch.setattr("src.answer_cache.time.time", lambda: now + 120)
+    assert cache.get("third question") is None
+    assert len(cache) == 0
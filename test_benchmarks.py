@@ -0,0 +1,92 @@
+import json
+
+import dspy
+import httpx
+import pytest
+
+from benchmarks.load import Turn, lm_response, percentile, standin_app, summarize
+from benchmarks.stubs import ANSWER, chat_response
+from benchmarks.suite import compare
+from src.lib import (
+    AnswerChunkEvent,
+    FinalAnswerEvent,
+    FoundArticleEvent,
+    SearchEvent,
+    SourcesEvent,
+    StopEvent,
+    aanswer_query,
+)
+
+
+def test_compare_flags_only_regressions_past_the_tolerance():
+    # arrange
+    baseline = {"fast": {"us": 100.0}, "noisy": {"us": 100.0, "tolerance": 1.0}}
+
+    # act
+    regressions = compare({"fast": 140.0, "noisy": 180.0, "new": 1e6}, baseline, tolerance=0.3)
+
+    # assert
+    assert len(regressions) == 1 and regressions[0].startswith("fast:")
+
+
+@pytest.mark.asyncio
+async def test_answer_stream_runs_offline_against_the_stubs(stub_pipeline):
+    # arrange
+    stub_pipeline()
+
+    # act
+    events = [e async for e in aanswer_query("How does a hepatic adenoma look on MRI?", dspy.History(messages=[]))]
+
+    # assert
+    assert [type(e) for e in events[:3]] == [SearchEvent, FoundArticleEvent, AnswerChunkEvent]
+    assert events[0].terms == ["hepatic adenoma"]
+    assert [type(e) for e in events[-3:]] == [FinalAnswerEvent, SourcesEvent, StopEvent]
+    assert events[-3].answer == ANSWER
+    assert events[-3].articles["urls"][0] == "https://radiopaedia.org/articles/hepatic-adenoma?lang=us"
+
+
+def test_summarize_reports_percentiles_per_turn_kind():
+    # arrange
+    turns = [Turn("first", first_frame=i / 100, completion=i / 10, frames=3) for i in range(1, 101)]
+    turns += [Turn("followup", first_frame=0.5, completion=1.0, frames=2), Turn("followup", error="ReadTimeout: ")]
+
+    # act
+    summary = summarize(turns, seconds=10.0)
+
+    # assert
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert summary["failed"] == 1 and summary["turns_per_second"] == 10.1
+    assert summary["first"]["completion_p50"] == pytest.approx(5.05)
+    assert summary["first"]["first_frame_p99"] == pytest.approx(0.9901)
+    assert summary["followup"]["count"] == 1 and summary["all"]["count"] == 101
+
+
+@pytest.mark.asyncio
+async def test_standin_lm_streams_the_response_for_the_requested_fields():
+    # arrange
+    app = standin_app(first_token_ms=0, token_ms=0, fetch_ms=0)
+    messages = [{"role": "system", "content": "Your output fields are:\n1. `answer` (str)"}, {"role": "user", "content": "q"}]
+
+    # act
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://standin") as client:
+        response = await client.post("/v1/chat/completions", json={"messages": messages, "stream": True})
+        search = await client.get("/search", params={"q": "Type 2 endoleak"})
+
+    # assert
+    chunks = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: {")]
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == chat_response(answer=ANSWER)
+    assert response.text.rstrip().endswith("data: [DONE]")
+    assert 'href="/articles/type-2-endoleak--hepatic-adenoma?lang=us"' in search.text
+
+
+def test_standin_lm_picks_a_topic_per_question():
+    # arrange
+    system = {"role": "system", "content": "Your output fields are:\n1. `reasoning` (str)\n2. `main_topics` (list[str])"}
+
+    # act
+    responses = [lm_response([system, {"role": "user", "content": f"question {i}"}], topics=3) for i in range(20)]
+
+    # assert
+    assert all("[[ ## main_topics ## ]]" in r for r in responses)
+    assert len(set(responses)) == 3
+    assert responses[0] == lm_response([system, {"role": "user", "content": "question 0"}], topics=3)
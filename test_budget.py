@@ -0,0 +1,41 @@
+from src.budget import estimate_tokens, fit_articles, fit_history
+
+import dspy
+
+
+def test_fit_history_keeps_most_recent_turns():
+    # arrange
+    history = dspy.History(messages=[
+        {"user_query": f"question {i}", "answer": "a" * 400, "articles": {"urls": []}}
+        for i in range(5)
+    ])
+
+    # act
+    trimmed, used = fit_history(history, max_tokens=250)
+
+    # assert
+    assert [m["user_query"] for m in trimmed.messages] == ["question 3", "question 4"]
+    assert used <= 250
+    assert len(history.messages) == 5
+
+
+def test_fit_history_truncates_a_single_long_turn():
+    history = dspy.History(messages=[{"user_query": "q", "answer": "word " * 1000}])
+
+    trimmed, used = fit_history(history, max_tokens=100)
+
+    assert len(trimmed.messages) == 1
+    assert used <= 100
+
+
+def test_fit_articles_redistributes_unused_budget():
+    # arrange
+    short, long_a, long_b = "x" * 40, "y " * 2000, "z " * 2000
+
+    # act
+    fitted = fit_articles([long_a, short, long_b], max_tokens=1010)
+
+    # assert
+    assert fitted[1] == short
+    assert sum(map(estimate_tokens, fitted)) <= 1010
+    assert estimate_tokens(fitted[0]) > 450 and estimate_tokens(fitted[2]) > 450
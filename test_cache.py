@@ -0,0 +1,97 @@
+from src.cache import LRUCache, SingleFlight
+
+import asyncio
+import threading
+import time
+import pytest
+
+
+def test_single_flight_coalesces_threads():
+    # arrange
+    flights = SingleFlight()
+    calls = 0
+    barrier = threading.Barrier(5)
+    results = []
+
+    def fetch():
+        nonlocal calls
+        calls += 1
+        time.sleep(0.05)
+        return "content"
+
+    def worker():
+        barrier.wait()
+        results.append(flights.do("url", fetch))
+
+    # act
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # assert
+    assert calls == 1
+    assert results == ["content"] * 5
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_tasks():
+    # arrange
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch(key):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    # act
+    results = await asyncio.gather(*(flights.ado("stroke", fetch, "stroke") for _ in range(5)))
+
+    # assert
+    assert calls == 1
+    assert results == ["STROKE"] * 5
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    # arrange
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    # act
+    results = await asyncio.gather(*(flights.ado("url", fetch) for _ in range(3)), return_exceptions=True)
+
+    # assert
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_lru_cache_evicts_by_entries_and_bytes():
+    # arrange
+    cache = LRUCache(max_entries=2, max_bytes=100)
+
+    # act
+    cache.put("stroke", "a", size=10)
+    cache.put("pe", "b", size=10)
+    cache.get("stroke")
+    cache.put("liver", "c", size=10)  # evicts "pe", the least recently used
+    cache.put("huge", "d", size=95)  # evicts everything else to fit
+
+    # assert
+    assert cache.get("pe") is None
+    assert cache.get("stroke") is None
+    assert cache.get("huge") == "d"
+    assert cache.stats() == {"hits": 2, "misses": 2, "evictions": 3, "entries": 1, "bytes": 95}
+
+
+def test_lru_cache_skips_oversized_values():
+    cache = LRUCache(max_entries=10, max_bytes=5)
+    cache.put("article", "x" * 100)
+    assert len(cache) == 0
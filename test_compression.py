@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import apsw
+import pytest
+
+from src.compress_cache import main, recode_table, table_report
+from src.compression import decode, encode
+from src.extract import extract_article_text
+from src.lib import open_db, write_article_text, search_index
+
+ARTICLE = extract_article_text(Path("benchmarks/fixtures/article.html").read_text())
+
+
+def test_values_round_trip_and_plain_text_still_reads():
+    # act
+    compressed = encode(ARTICLE, "zlib")
+
+    # assert
+    assert isinstance(compressed, bytes) and len(compressed) < len(ARTICLE) / 2
+    assert decode(compressed) == ARTICLE
+    assert decode(compressed, max_chars=300) == ARTICLE[:300]
+    assert decode(ARTICLE) == ARTICLE
+    assert encode("short", "zlib") == "short"
+    with pytest.raises(ValueError):
+        decode(b"\x7fnot a known format")
+
+
+def test_recoding_keeps_the_search_index_working():
+    # arrange
+    db = open_db(":memory:")
+    cursor = db.cursor()
+    with db.connection():
+        write_article_text(cursor, "https://radiopaedia.org/articles/hepatic-adenoma?lang=us", ARTICLE)
+        write_article_text(cursor, "https://radiopaedia.org/articles/stroke?lang=us", "Stroke is a clinical diagnosis.")
+
+    # act
+    changed = recode_table(db, "radiopaedia_articles", "zlib", batch_size=1)
+    report = table_report(db, "radiopaedia_articles")
+
+    # assert
+    assert changed == 1
+    assert report["rows"] == 2 and report["ratio"] > 2
+    (url, content), = search_index("adenoma", cursor)
+    assert decode(content) == ARTICLE
+    assert recode_table(db, "radiopaedia_articles", "none") == 1
+    assert table_report(db, "radiopaedia_articles")["ratio"] == 1.0
+
+
+def test_compressing_a_database_from_before_the_structured_search_results(tmp_path, capsys):
+    # arrange
+    path = str(tmp_path / "cache.db")
+    connection = apsw.Connection(path)
+    connection.execute("CREATE TABLE radiopaedia_search_results (search_query TEXT PRIMARY KEY, search_results TEXT)")
+    connection.execute("CREATE TABLE radiopaedia_articles (url TEXT PRIMARY KEY, content TEXT)")
+    connection.execute(
+        "INSERT INTO radiopaedia_search_results VALUES (?, ?)",
+        ("hepatic adenoma", Path("benchmarks/fixtures/search.html").read_bytes()),
+    )
+    connection.execute("INSERT INTO radiopaedia_articles VALUES (?, ?)", ("https://radiopaedia.org/articles/hepatic-adenoma", ARTICLE))
+    connection.close()
+
+    # act
+    reported = main(["--db", path, "--report"])
+    recoded = main(["--db", path])
+
+    # assert
+    assert reported == recoded == 0
+    assert "radiopaedia_articles: re-encoded 1 rows as zlib" in capsys.readouterr().out
+    db = open_db(path)
+    assert table_report(db, "radiopaedia_search_results")["rows"] == 1
+    assert decode(db.execute("SELECT content FROM radiopaedia_articles").fetchall()[0][0]) == ARTICLE
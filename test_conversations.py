@@ -0,0 +1,97 @@
+from src.conversations import ConversationManager, MemoryConversationStore, SQLiteConversationStore
+
+import apsw
+import pytest
+import time
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request):
+    return MemoryConversationStore() if request.param == "memory" else SQLiteConversationStore(":memory:")
+
+
+def test_add_turn_keeps_article_urls_of_first_turn_only(store):
+    # arrange
+    manager = ConversationManager(store=store)
+    conv_id, history = manager.get_or_create_conversation()
+    articles = {"urls": ["https://radiopaedia.org/articles/stroke"], "main_topics": ["stroke"]}
+
+    # act
+    manager.add_turn(conv_id, history, "What is a stroke?", "A stroke is ...", articles)
+    _, history = manager.get_or_create_conversation(conv_id)
+    manager.add_turn(conv_id, history, "And on CT?", "On CT ...", articles)
+
+    # assert
+    messages = manager.get_conversation(conv_id).messages
+    assert messages[0]["articles"] == {"urls": ["https://radiopaedia.org/articles/stroke"]}
+    assert "articles" not in messages[1]
+    assert [m["user_query"] for m in messages] == ["What is a stroke?", "And on CT?"]
+
+
+def test_least_recently_used_conversations_are_evicted(store):
+    # arrange
+    manager = ConversationManager(store=store, max_conversations=2)
+    first, _ = manager.get_or_create_conversation()
+    second, _ = manager.get_or_create_conversation()
+    manager.get_or_create_conversation(first)
+
+    # act
+    third, _ = manager.get_or_create_conversation()
+
+    # assert
+    assert set(manager.list_conversations()) == {first, third}
+    with pytest.raises(KeyError):
+        manager.get_conversation(second)
+
+
+def test_idle_conversations_are_evicted(store, monkeypatch):
+    # arrange
+    manager = ConversationManager(store=store, idle_ttl=60)
+    conv_id, _ = manager.get_or_create_conversation()
+    monkeypatch.setattr("src.conversations.time.time", lambda: 1e12)
+
+    # act
+    evicted = manager.evict()
+
+    # assert
+    assert evicted == 1
+    assert manager.delete_conversation(conv_id) is False
+
+
+def test_sqlite_store_survives_restarts(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    manager = ConversationManager(store=SQLiteConversationStore(db_path))
+    conv_id, history = manager.get_or_create_conversation()
+    manager.add_turn(conv_id, history, "q", "a", {"urls": []})
+    manager.close()
+
+    restarted = ConversationManager(store=SQLiteConversationStore(db_path))
+
+    assert restarted.get_conversation(conv_id).messages == [{"user_query": "q", "answer": "a", "articles": {"urls": []}}]
+
+
+def test_sqlite_store_doesnt_wait_for_writers(tmp_path):
+    # arrange
+    db_path = str(tmp_path / "conversations.db")
+    store = SQLiteConversationStore(db_path)
+    manager = ConversationManager(store=store)
+    conv_id, history = manager.get_or_create_conversation()
+    manager.add_turn(conv_id, history, "q", "a", {"urls": []})
+    store.writes.flush()
+    other_worker = apsw.Connection(db_path)
+    other_worker.execute("BEGIN IMMEDIATE")
+
+    # act
+    start = time.perf_counter()
+    _, history = manager.get_or_create_conversation(conv_id)
+    manager.add_turn(conv_id, history, "q2", "a2", {"urls": []})
+    new_id, _ = manager.get_or_create_conversation()
+    messages = manager.get_conversation(conv_id).messages
+    seconds = time.perf_counter() - start
+    other_worker.execute("COMMIT")
+
+    # assert
+    assert [m["user_query"] for m in messages] == ["q", "q2"]
+    assert seconds < 1.0
+    assert set(manager.list_conversations()) == {conv_id, new_id}
+    assert manager.get_conversation(conv_id).messages == messages
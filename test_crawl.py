@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import src.lib
+from benchmarks.stubs import chat_response, stub_lm
+from src.crawl import Crawler, load_jobs
+from src.lib import AnswerPipeline, article_memory, search_memory
+
+SEARCH_PAGE = """<a class="search-result search-result-article" href="/articles/{slug}?lang=us">
+  <div class="search-result-title">{title}</div><div class="search-result-body">About {title}</div>
+</a>"""
+
+
+@pytest.fixture
+def fake_radiopaedia(monkeypatch, clean_db):
+    requests = []
+
+    async def mock_get(url, params=None, **kwargs):
+        requests.append(url if params is None else params["q"])
+        if params is not None:
+            slug = params["q"].replace(" ", "-")
+            return httpx.Response(200, text=SEARCH_PAGE.format(slug=slug, title=params["q"]))
+        return httpx.Response(200, text=f'<div id="content"><div class="body user-generated-content">text of {url}</div></div>')
+
+    monkeypatch.setattr(src.lib.get_async_http_client(), "get", mock_get)
+    return requests
+
+
+def test_load_jobs_from_test_queries():
+    # act
+    topics, urls, questions = load_jobs("data/test_queries.tsv")
+
+    # assert
+    assert "hepatic adenoma" in topics and "focular nodular hyperplasia" in topics
+    assert "https://radiopaedia.org/articles/focal-nodular-hyperplasia?lang=us" in urls
+    assert questions == []
+
+
+@pytest.mark.asyncio
+async def test_crawl_seeds_the_cache_and_resumes(fake_radiopaedia, tmp_path):
+    # arrange
+    checkpoint = str(tmp_path / "checkpoint.txt")
+    topics = ["hepatic adenoma", "stroke"]
+
+    # act
+    stats = await Crawler(rate=0, checkpoint=checkpoint).run(topics, ["https://radiopaedia.org/articles/meningioma?lang=us"])
+    article_memory.clear()
+    search_memory.clear()
+    resumed = await Crawler(rate=0, checkpoint=checkpoint).run(topics + ["meningioma"], [])
+
+    # assert
+    assert stats.fetched == 5 and stats.failed == 0
+    cursor = src.lib.db.cursor()
+    assert cursor.execute("SELECT count(*) FROM radiopaedia_articles").fetchall()[0][0] == 3
+    assert cursor.execute("SELECT count(*) FROM radiopaedia_search_results").fetchall()[0][0] == 3
+    assert resumed.resumed == 5 and resumed.fetched == 1
+    assert fake_radiopaedia.count("hepatic adenoma") == 1
+
+
+@pytest.mark.asyncio
+async def test_crawled_questions_use_the_apps_predictor(fake_radiopaedia, monkeypatch):
+    # arrange
+    pipeline = AnswerPipeline("models/kimi_finder.json")
+    monkeypatch.setattr("src.lib._pipeline", pipeline)
+    monkeypatch.setattr("src.lib.lm_cache.predictors", {"generate_search_query"})
+    predictor = pipeline.modules.qa.find_articles.generate_search_query
+    predictor.set_lm(stub_lm(chat_response(reasoning="Topics of the query.", main_topics=json.dumps(["hepatic adenoma"]))))
+    question = "How does a hepatic adenoma look on MRI?"
+
+    # act
+    stats = await Crawler(rate=0).run([], [], [question])
+    hits = src.lib.lm_cache.stats()["hits"]
+    await src.lib.lm_cache.acall("generate_search_query", predictor, user_query=question)
+
+    # assert
+    assert stats.failed == 0 and "hepatic adenoma" in fake_radiopaedia
+    assert src.lib.lm_cache.stats()["hits"] == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_failed_topic_extraction_doesnt_abort_the_crawl(fake_radiopaedia, monkeypatch, tmp_path):
+    # arrange
+    checkpoint = str(tmp_path / "checkpoint.txt")
+
+    async def acall(name, predictor, user_query):
+        if "rate limited" in user_query:
+            raise RuntimeError("rate limited")
+        return SimpleNamespace(main_topics=["hepatic adenoma"])
+    monkeypatch.setattr("src.lib.lm_cache.acall", acall)
+    questions = ["How does a hepatic adenoma look on MRI?", "A question that is rate limited?"]
+
+    # act
+    stats = await Crawler(rate=0, checkpoint=checkpoint).run(["stroke"], [], questions)
+    resumed = await Crawler(rate=0, checkpoint=checkpoint).run([], [], questions)
+
+    # assert
+    assert stats.failed == 1 and stats.extracted == 1 and stats.fetched == 4
+    assert resumed.resumed == 1 and resumed.failed == 1
+    assert fake_radiopaedia.count("hepatic adenoma") == 1
@@ -0,0 +1,92 @@
+import threading
+
+from src.db import Database, WriteBehind
+
+
+def test_each_thread_gets_its_own_connection_in_wal_mode(tmp_path):
+    # arrange
+    db = Database(str(tmp_path / "cache.db"))
+    connections = []
+
+    # act
+    thread = threading.Thread(target=lambda: connections.append(db.connection()))
+    thread.start()
+    thread.join()
+    connections.append(db.connection())
+
+    # assert
+    assert connections[0] is not connections[1]
+    assert db.execute("PRAGMA journal_mode").fetchall()[0][0] == "wal"
+
+
+def test_setup_runs_once_for_all_threads(tmp_path):
+    # arrange
+    calls = []
+    db = Database(str(tmp_path / "cache.db"), setup=lambda cursor: calls.append(cursor.execute("CREATE TABLE t (x)")))
+
+    # act
+    threads = [threading.Thread(target=lambda: db.execute("INSERT INTO t VALUES (1)")) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    assert len(calls) == 1
+    assert db.execute("SELECT count(*) FROM t").fetchall()[0][0] == 4
+
+
+def test_writes_are_visible_to_other_connections(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    Database(db_path, setup=lambda cursor: cursor.execute("CREATE TABLE t (x)")).execute("INSERT INTO t VALUES (1)")
+
+    assert Database(db_path).execute("SELECT x FROM t").fetchall() == [(1,)]
+
+
+def insert(cursor, x):
+    cursor.execute("INSERT INTO t VALUES (?)", (x,))
+
+
+def test_write_behind_commits_in_batches(tmp_path):
+    # arrange
+    db = Database(str(tmp_path / "cache.db"), setup=lambda cursor: cursor.execute("CREATE TABLE t (x UNIQUE)"))
+    writes = WriteBehind(db, max_rows=10, max_delay_ms=1000)
+
+    # act
+    for x in range(25):
+        writes.submit(insert, x)
+    writes.flush()
+
+    # assert
+    assert db.execute("SELECT count(*) FROM t").fetchall()[0][0] == 25
+    assert writes.stats()["batches"] == 3
+    writes.close()
+
+
+def test_write_behind_keeps_the_batch_when_one_write_fails(tmp_path):
+    # arrange
+    db = Database(str(tmp_path / "cache.db"), setup=lambda cursor: cursor.execute("CREATE TABLE t (x UNIQUE)"))
+    writes = WriteBehind(db)
+
+    # act
+    for x in [1, 2, 2, 3]:
+        writes.submit(insert, x)
+    writes.close()
+
+    # assert
+    assert db.execute("SELECT x FROM t ORDER BY x").fetchall() == [(1,), (2,), (3,)]
+    assert writes.stats()["errors"] == 1
+
+
+def test_write_behind_reports_committed_writes(tmp_path):
+    # arrange
+    db = Database(str(tmp_path / "cache.db"), setup=lambda cursor: cursor.execute("CREATE TABLE t (x UNIQUE)"))
+    writes = WriteBehind(db)
+    seen = []
+
+    # act
+    writes.submit(insert, 1, committed=lambda: seen.append(db.execute("SELECT x FROM t").fetchall()))
+    writes.close()
+
+    # assert
+    assert seen == [[(1,)]]
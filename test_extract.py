@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from src.extract import BACKENDS, extract_article_text, extract_search_results
+
+FIXTURES = Path("benchmarks/fixtures")
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_backends_extract_the_same_article_text(backend):
+    # arrange
+    html = (FIXTURES / "article.html").read_text()
+
+    # act
+    text = extract_article_text(html, backend)
+
+    # assert
+    assert text == extract_article_text(html, "bs4")
+    assert text.startswith("Hepatic adenomas,\xa0or hepatocellular adenomas (HCA)")
+    assert "Related case" not in text and "dataLayer" not in text
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_backends_extract_the_same_search_results(backend):
+    # arrange
+    html = (FIXTURES / "search.html").read_text()
+
+    # act
+    results = extract_search_results(html, backend)
+
+    # assert
+    assert results == extract_search_results(html, "bs4")
+    assert len(results) == 20
+    assert results[0] == {
+        "id": 0,
+        "title": "Hepatic adenoma",
+        "body": results[0]["body"],
+        "href": "/articles/hepatic-adenoma?lang=us",
+    }
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_article_body_is_found_without_the_expected_markup_order(backend):
+    # arrange: the content marker shows up in a script before the real content div
+    html = """<html><head><script>var s = 'id="content"';</script></head><body>
+    <div id="content"><!-- article --><div class="user-generated-content body">Text <script>x()</script>here</div></div>
+    </body></html>"""
+
+    # act / assert
+    assert extract_article_text(html, backend) == "Text here"
+    with pytest.raises(ValueError):
+        extract_article_text("<html><body><p>Not found</p></body></html>", backend)
@@ -0,0 +1,48 @@
+from src.keywords import guess_topics, same_topic
+
+
+def test_guess_topics_keeps_the_names_of_a_query():
+    # act
+    guesses = [
+        guess_topics("How can I differentiate hepatic adenoma from FNH on MRI?"),
+        guess_topics("What are the typical features of granulomatosis with polyangiitis on CT?"),
+        guess_topics("What are the stages of lymphangioleiomyomatosis (LAM)?"),
+        guess_topics("Question 3: what are the imaging features of hemorrhagic transformation of ischemic stroke?"),
+    ]
+
+    # assert
+    assert guesses == [
+        ["hepatic adenoma", "fnh"],
+        ["granulomatosis with polyangiitis"],
+        ["lymphangioleiomyomatosis"],
+        ["hemorrhagic transformation of ischemic stroke"],
+    ]
+
+
+def test_guess_topics_distributes_shared_words():
+    # act
+    guesses = [
+        guess_topics("type 1 and type 2 endoleaks on CTA"),
+        guess_topics("central and peripheral cholangiocarcinoma"),
+        guess_topics("hepatic adenoma or focal nodular hyperplasia"),
+    ]
+
+    # assert
+    assert guesses == [
+        ["type 1 endoleaks", "type 2 endoleaks"],
+        ["central cholangiocarcinoma", "peripheral cholangiocarcinoma"],
+        ["hepatic adenoma", "focal nodular hyperplasia"],
+    ]
+
+
+def test_guess_topics_of_a_query_without_names():
+    assert guess_topics("How does it look on MRI?") == []
+
+
+def test_same_topic():
+    assert same_topic("Hepatic adenomas", "hepatic adenoma")
+    assert not same_topic("hepatic adenoma", "adenoma")
+    assert not same_topic("fnh", "focal nodular hyperplasia")
+    assert not same_topic("meningioma", "meningitis")
+    assert not same_topic("lung carcinoma", "carcinoma of the lung")
+    assert not same_topic("type 1 endoleak", "type 2 endoleak")
@@ -1,21 +1,46 @@
-from lib import (
+from src.lib import (
     structure_search_result,
     ErrorEvent,
     StopEvent,
+    SearchEvent,
+    FoundArticleEvent,
+    Retrieval,
     aanswer_query,
-    setup_db
+    afetch_articles,
+    get_article_text,
+    top_article_urls,
+    migrate_db,
+    cached_search_results,
+    SCHEMA_VERSION,
+    get_pipeline,
+    store_article_text,
+    search_radiopaedia,
+    PipelineModules,
+    PromptContext,
+    AnswerChunkEvent,
+    FinalAnswerEvent,
+    SourcesEvent,
+    CorrectionEvent,
+    answer_cache,
+    answer_streamer,
 )
+from src import metrics
+from src.metrics import Histogram
+import src.lib
 
 from bs4 import BeautifulSoup
+import apsw
+import asyncio
 import pytest
 import dspy
 import httpx
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from benchmarks.stubs import ANSWER as stub_answer
 
-@pytest.fixture
-def clean_db(monkeypatch):
-    fresh_cursor = setup_db(":memory:")
-    monkeypatch.setattr("lib.c", fresh_cursor)
-    return fresh_cursor
 
 def test_structure_search_results():
     # Arrange
@@ -50,41 +75,369 @@ Hepatic adenomas,&nbsp;or hepatocellular adenomas (HCA), are benign,&nbsp;genera
     assert result["href"] == "/articles/hepatic-adenoma?lang=us"
 
 @pytest.mark.asyncio
-async def test_stream_error_handling(monkeypatch, clean_db):
+async def test_stream_error_handling(monkeypatch, stub_pipeline, caplog):
     # arrange
+    stub_pipeline()
+
     def mock_streamify(*args, **kwargs):
-        # return a mock that raises when iterated
-        async def failing_stream(*args, **kwargs):
+        # a stream that fails on its first chunk
+        async def failing_stream(**kwargs):
             raise Exception("Test error")
+            yield
         return failing_stream
 
-    monkeypatch.setattr("lib.dspy.streamify", mock_streamify)
+    monkeypatch.setattr("src.lib.dspy.streamify", mock_streamify)
 
     # act
     res = []
-    async for e in aanswer_query(query="foobar", history = dspy.History(messages=[])):
-        res.append(e)
+    async for e in aanswer_query(query="What is a hepatic adenoma?", history=dspy.History(messages=[])):
+        if not isinstance(e, (SearchEvent, FoundArticleEvent)):
+            res.append(e)
 
     # assert
-    assert len(res) == 2
-    assert isinstance(res[0], ErrorEvent)
-    assert isinstance(res[1], StopEvent)
+    assert res == [ErrorEvent(message="Something went wrong. Please try again."), StopEvent()]
+    assert "Error occurred: Test error" in caplog.text
 
 @pytest.mark.asyncio
-async def test_http_error(monkeypatch, clean_db):
+async def test_http_error(monkeypatch, stub_pipeline):
     # arrange
-    def mock_get(*args, **kwargs):
-        # return a mock that raises when iterated
+    stub_pipeline(topics=["meningioma"])
+    requested = []
+
+    async def mock_get(url, *args, **kwargs):
+        requested.append(url)
         raise httpx.HTTPError("Test error")
-    monkeypatch.setattr("lib.client.get", mock_get)
+    monkeypatch.setattr(src.lib.get_async_http_client(), "get", mock_get)
 
     # act
     res = []
     async for e in aanswer_query(query="What is a meningeoma?", history = dspy.History(messages=[])):
-        res.append(e)
+        if not isinstance(e, (SearchEvent, FoundArticleEvent)):
+            res.append(e)
 
     # assert
-    print(res)
+    assert requested and all(url == src.lib.search_url for url in requested)
     assert len(res) == 2
     assert isinstance(res[0], ErrorEvent)
     assert isinstance(res[1], StopEvent)
+
+@pytest.mark.asyncio
+async def test_afetch_articles_concurrent(monkeypatch, clean_db):
+    # arrange
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_get(url, *args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        html = f'<div id="content"><div class="body user-generated-content">text of {url}</div></div>'
+        return httpx.Response(200, text=html)
+    monkeypatch.setattr(src.lib.get_async_http_client(), "get", mock_get)
+
+    urls = [f"https://radiopaedia.org/articles/{i}" for i in range(4)]
+
+    # act
+    res = await afetch_articles(urls, cursor=clean_db)
+
+    # assert
+    assert res == [f"text of {url}" for url in urls]
+    assert max_in_flight == 4
+    assert get_article_text(urls[0], cursor=clean_db) == f"text of {urls[0]}"
+
+def test_top_article_urls():
+    # arrange
+    results_per_topic = [
+        [{"href": "/articles/hepatic-adenoma"}, {"href": "/articles/fnh"}, {"href": "/articles/hcc"}],
+        [{"href": "/articles/fnh"}, {"href": "/articles/liver"}],
+    ]
+
+    # act
+    urls = top_article_urls(results_per_topic)
+
+    # assert
+    assert urls == [
+        "https://radiopaedia.org/articles/hepatic-adenoma",
+        "https://radiopaedia.org/articles/fnh",
+        "https://radiopaedia.org/articles/liver",
+    ]
+
+def test_migrate_search_results_from_html(clean_db):
+    # arrange
+    cursor = apsw.Connection(":memory:").cursor()
+    cursor.execute(
+        "CREATE TABLE radiopaedia_search_results (search_query TEXT PRIMARY KEY, search_results TEXT)"
+    )
+    cursor.execute("CREATE TABLE radiopaedia_articles (url TEXT PRIMARY KEY, content TEXT)")
+    page = b"""<html><body>
+<a class="search-result" href="/articles/hepatic-adenoma?lang=us">
+  <div class="search-result-title"><h4>Hepatic adenoma</h4></div>
+  <div class="search-result-body">Benign liver tumor.</div>
+</a>
+<a class="search-result" href="/articles/fnh?lang=us">
+  <div class="search-result-title"><h4>Focal nodular hyperplasia</h4></div>
+  <div class="search-result-body">Second most common benign liver tumor.</div>
+</a>
+</body></html>"""
+    cursor.execute("INSERT INTO radiopaedia_search_results VALUES (?, ?)", ("hepatic adenoma", page))
+
+    # act
+    migrate_db(cursor)
+    migrate_db(cursor)
+
+    # assert
+    assert cursor.execute("PRAGMA user_version").fetchall()[0][0] == SCHEMA_VERSION
+    results = cached_search_results("hepatic adenoma", cursor)
+    assert [r["href"] for r in results] == ["/articles/hepatic-adenoma?lang=us", "/articles/fnh?lang=us"]
+    assert results[1] == {
+        "id": 1,
+        "title": "Focal nodular hyperplasia",
+        "body": "Second most common benign liver tumor.",
+        "href": "/articles/fnh?lang=us",
+    }
+
+def test_pipeline_built_once_and_reloadable(monkeypatch):
+    # arrange
+    monkeypatch.setattr("src.lib._pipeline", None)
+
+    # act
+    pipeline = get_pipeline()
+    modules = pipeline.modules
+    pipeline.reload()
+
+    # assert
+    assert get_pipeline() is pipeline
+    assert pipeline.modules is not modules
+    assert pipeline.modules.qa is not modules.qa
+
+
+@pytest.mark.asyncio
+async def test_answer_streamer_streams_every_call():
+    # arrange
+    predict = dspy.Predict("question -> answer")
+    predict.set_lm(dspy.LM("openai/stub", api_key="stub", mock_response="[[ ## answer ## ]]\nIt depends on the phase.\n\n[[ ## completed ## ]]", cache=False))
+    stream = answer_streamer(predict)
+
+    # act
+    calls = [[c async for c in stream(question=f"question {i}")] for i in range(2)]
+
+    # assert
+    for chunks in calls:
+        assert any(isinstance(c, dspy.streaming.StreamResponse) for c in chunks)
+        assert "".join(c.chunk for c in chunks if isinstance(c, dspy.streaming.StreamResponse)).strip() == "It depends on the phase."
+
+
+def test_local_first_search_uses_cached_articles(monkeypatch, clean_db):
+    # arrange
+    def mock_get(*args, **kwargs):
+        raise httpx.HTTPError("network disabled")
+    monkeypatch.setattr(src.lib.get_http_client(), "get", mock_get)
+    monkeypatch.setattr("src.lib.SEARCH_MODE", "local_first")
+    store_article_text("https://radiopaedia.org/articles/hepatic-adenoma?lang=us", "Hepatic adenomas are benign liver tumors.")
+    store_article_text("https://radiopaedia.org/articles/focal-nodular-hyperplasia?lang=us", "FNH is a benign liver tumor, unlike a hepatic adenoma it ...")
+    store_article_text("https://radiopaedia.org/articles/stroke?lang=us", "Stroke is a clinical diagnosis.")
+    src.lib.cache_writes.flush()
+
+    # act
+    results = search_radiopaedia("hepatic adenomas", clean_db)
+
+    # assert
+    assert [r["href"] for r in results] == [
+        "/articles/hepatic-adenoma?lang=us",
+        "/articles/focal-nodular-hyperplasia?lang=us",
+    ]
+    assert results[0]["title"] == "hepatic adenoma"
+
+
+def test_local_first_search_falls_back_to_network(monkeypatch, clean_db):
+    # arrange
+    def mock_get(*args, **kwargs):
+        raise httpx.HTTPError("network disabled")
+    monkeypatch.setattr(src.lib.get_http_client(), "get", mock_get)
+    monkeypatch.setattr("src.lib.SEARCH_MODE", "local_first")
+    store_article_text("https://radiopaedia.org/articles/stroke?lang=us", "Stroke is a clinical diagnosis.")
+    src.lib.cache_writes.flush()
+
+    # act / assert
+    with pytest.raises(httpx.HTTPError):
+        search_radiopaedia("meningioma", clean_db)
+
+
+def fake_pipeline(checks: list[bool], regenerated: list[str]):
+    """Pipeline modules that stream a fixed first answer, without any LLM calls."""
+    async def astream_retrieval(query, history):
+        articles = {"urls": ["https://radiopaedia.org/articles/meningioma"], "main_topics": ["meningioma"]}
+        yield Retrieval(
+            articles=articles,
+            prompt=PromptContext(context=["Meningiomas are dural based."], history=history, context_tokens=7, history_tokens=0),
+        )
+
+    def stream_answer(**kwargs):
+        async def stream():
+            for token in ["Menin", "gioma"]:
+                yield dspy.streaming.StreamResponse(predict_name="answer_query", signature_field_name="answer", chunk=token)
+            yield dspy.Prediction(answer="Meningioma", context=kwargs["context"], articles=kwargs["articles"])
+        return stream()
+
+    async def check(**kwargs):
+        return SimpleNamespace(is_faithful=checks.pop(0))
+
+    async def regenerate(**kwargs):
+        answer = regenerated.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return SimpleNamespace(answer=answer)
+
+    qa = SimpleNamespace(astream_retrieval=astream_retrieval, answer_query=SimpleNamespace(acall=regenerate))
+    modules = PipelineModules(
+        qa=qa, check_faithfulness=SimpleNamespace(acall=check), stream_qa=None, stream_answer=stream_answer
+    )
+    return SimpleNamespace(modules=modules)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_verification_keeps_faithful_answer(monkeypatch):
+    # arrange
+    answer_cache.clear()
+    monkeypatch.setattr("src.lib.lm_cache.predictors", set())
+    monkeypatch.setattr("src.lib._pipeline", fake_pipeline(checks=[True], regenerated=[]))
+    monkeypatch.setattr("src.lib.VERIFY_MODE", "concurrent")
+
+    # act
+    res = [e async for e in aanswer_query(query="meningioma?", history=dspy.History(messages=[]))]
+
+    # assert
+    assert [type(e) for e in res] == [AnswerChunkEvent, AnswerChunkEvent, FinalAnswerEvent, SourcesEvent, StopEvent]
+    assert res[2].answer == "Meningioma"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_verification_corrects_unfaithful_answer(monkeypatch):
+    # arrange
+    answer_cache.clear()
+    monkeypatch.setattr("src.lib.lm_cache.predictors", set())
+    checks = [False, False]
+    monkeypatch.setattr("src.lib._pipeline", fake_pipeline(checks=checks, regenerated=["second", "third"]))
+    monkeypatch.setattr("src.lib.VERIFY_MODE", "concurrent")
+    monkeypatch.setattr("src.lib.MAX_ANSWER_ATTEMPTS", 3)
+
+    # act
+    res = [e async for e in aanswer_query(query="meningioma?", history=dspy.History(messages=[]))]
+
+    # assert
+    corrections = [e for e in res if isinstance(e, CorrectionEvent)]
+    assert [c.answer for c in corrections] == ["second", "third"]
+    assert corrections[0].sources[0].url == "https://radiopaedia.org/articles/meningioma"
+    assert isinstance(res[-1], StopEvent)
+    # the last attempt isn't checked, so it isn't known to be faithful and isn't cached either
+    assert checks == []
+    assert answer_cache.get("meningioma?") is None
+
+
+@pytest.mark.asyncio
+async def test_failed_regeneration_keeps_the_sent_answer(monkeypatch):
+    # arrange
+    answer_cache.clear()
+    monkeypatch.setattr("src.lib.lm_cache.predictors", set())
+    monkeypatch.setattr("src.lib._pipeline", fake_pipeline(checks=[False], regenerated=[TimeoutError("rate limited")]))
+    monkeypatch.setattr("src.lib.VERIFY_MODE", "concurrent")
+    monkeypatch.setattr("src.lib.MAX_ANSWER_ATTEMPTS", 3)
+
+    # act
+    res = [e async for e in aanswer_query(query="meningioma?", history=dspy.History(messages=[]))]
+
+    # assert
+    assert [type(e) for e in res] == [AnswerChunkEvent, AnswerChunkEvent, FinalAnswerEvent, SourcesEvent, StopEvent]
+    assert answer_cache.get("meningioma?") is None
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_replays_first_turn_answers(monkeypatch):
+    # arrange
+    answer_cache.clear()
+    monkeypatch.setattr("src.lib.lm_cache.predictors", set())
+    monkeypatch.setattr("src.lib._pipeline", fake_pipeline(checks=[True], regenerated=[]))
+    [e async for e in aanswer_query(query="What is a meningioma?", history=dspy.History(messages=[]))]
+    monkeypatch.setattr("src.lib._pipeline", None)  # a cache miss would now have to build a real pipeline
+
+    # act
+    res = [e async for e in aanswer_query(query="what is a meningioma", history=dspy.History(messages=[]))]
+
+    # assert
+    assert [type(e) for e in res] == [FinalAnswerEvent, SourcesEvent, StopEvent]
+    assert res[0].answer == "Meningioma"
+    assert res[0].articles["urls"] == ["https://radiopaedia.org/articles/meningioma"]
+
+
+def test_import_defers_heavy_setup():
+    # arrange
+    code = "import sys, src.lib; print(sorted(m for m in ('sklearn', 'mlflow') if m in sys.modules), src.lib._http_client)"
+    env = {**os.environ, "DB_PATH": ":memory:", "LM_CACHE_PATH": ":memory:"}
+
+    # act
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+
+    # assert
+    assert output.strip().splitlines()[-1] == "[] None"
+
+
+def test_warm_up_creates_what_requests_need(monkeypatch):
+    # arrange
+    monkeypatch.setattr("src.lib._http_client", None)
+    monkeypatch.setattr("src.lib._async_http_client", None)
+    monkeypatch.setattr("src.lib._pipeline", None)
+
+    # act
+    src.lib.warm_up()
+
+    # assert
+    assert src.lib._http_client is not None and src.lib._async_http_client is not None
+    assert src.lib._pipeline is not None
+    assert "sklearn" in sys.modules
+
+
+@pytest.mark.asyncio
+async def test_concurrent_answers_dont_leak_dspy_settings(monkeypatch, stub_pipeline):
+    # arrange
+    stub_pipeline()
+
+    async def answer(query):
+        return [e async for e in aanswer_query(query=query, history=dspy.History(messages=[]))]
+
+    # act
+    first, second = await asyncio.gather(answer("What is a hepatic adenoma?"), answer("What is an FNH?"))
+
+    # assert
+    for res in (first, second):
+        assert [e.answer for e in res if isinstance(e, FinalAnswerEvent)] == [stub_answer]
+    assert dspy.settings.send_stream is None
+
+
+@pytest.mark.asyncio
+async def test_speculative_search_keeps_agreeing_guesses(monkeypatch, stub_pipeline):
+    # arrange
+    monkeypatch.setattr("src.lib.RETRIEVAL_MODE", "speculative")
+    monkeypatch.setattr("src.metrics.STAGE_SECONDS", Histogram("test_stage_seconds", "Test.", ("stage", "result")))
+    modules = stub_pipeline(topics=["hepatic adenomas", "focal nodular hyperplasia"])
+    searched = []
+    asearch_results = src.lib.asearch_results
+
+    async def recording_asearch_results(search_term, cursor):
+        searched.append(search_term)
+        return await asearch_results(search_term, cursor)
+    monkeypatch.setattr("src.lib.asearch_results", recording_asearch_results)
+
+    # act
+    res = [e async for e in modules.qa.find_articles.astream("How can I differentiate hepatic adenoma from FNH?")]
+
+    # assert
+    assert res[:2] == [SearchEvent(terms=["hepatic adenoma", "fnh"]), SearchEvent(terms=["focal nodular hyperplasia"])]
+    assert res[2:4] == [FoundArticleEvent(term="hepatic adenomas"), FoundArticleEvent(term="focal nodular hyperplasia")]
+    assert res[-1].main_topics == ["hepatic adenomas", "focal nodular hyperplasia"]
+    assert searched == ["hepatic adenoma", "fnh", "focal nodular hyperplasia"]
+    counts = metrics.STAGE_SECONDS.counts()
+    assert counts[("speculative_search", "used")] == counts[("speculative_search", "discarded")] == 1
+    assert src.lib.search_memory.get("hepatic adenomas") == src.lib.search_memory.get("hepatic adenoma")
+    assert src.lib.search_memory.get("hepatic adenomas") is not None
@@ -0,0 +1,94 @@
+from src.lm_cache import LMCache
+
+import apsw
+import dspy
+import pytest
+import time
+
+
+class CountingLM(dspy.LM):
+    def __init__(self):
+        super().__init__("openai/fake-model", cache=False)
+        self.calls = 0
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        raise NotImplementedError
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        self.calls += 1
+        return ["[[ ## reasoning ## ]]\nTwo entities.\n\n[[ ## main_topics ## ]]\n[\"hepatic adenoma\", \"focal nodular hyperplasia\"]\n\n[[ ## completed ## ]]"]
+
+
+@pytest.fixture
+def lm():
+    lm = CountingLM()
+    with dspy.context(lm=lm):
+        yield lm
+
+
+def test_lm_cache_serves_repeated_calls(lm):
+    # arrange
+    cache = LMCache(":memory:", predictors={"generate_search_query"})
+    predictor = dspy.ChainOfThought("user_query -> main_topics: list[str]")
+
+    # act
+    first = cache.call("generate_search_query", predictor, user_query="adenoma vs FNH?")
+    second = cache.call("generate_search_query", predictor, user_query="adenoma vs FNH?")
+
+    # assert
+    assert lm.calls == 1
+    assert second.main_topics == first.main_topics == ["hepatic adenoma", "focal nodular hyperplasia"]
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_lm_cache_only_caches_opted_in_predictors(lm):
+    cache = LMCache(":memory:", predictors=set())
+    predictor = dspy.ChainOfThought("user_query -> main_topics: list[str]")
+
+    cache.call("generate_search_query", predictor, user_query="adenoma vs FNH?")
+    cache.call("generate_search_query", predictor, user_query="adenoma vs FNH?")
+
+    assert lm.calls == 2
+
+
+def test_lm_cache_key_changes_with_demos(lm):
+    cache = LMCache(":memory:", predictors={"generate_search_query"})
+    predictor = dspy.ChainOfThought("user_query -> main_topics: list[str]")
+    key = cache.key("generate_search_query", predictor, "openai/fake-model", {"user_query": "q"})
+
+    predictor.predict.demos = [dspy.Example(user_query="x", main_topics=["y"])]
+
+    assert cache.key("generate_search_query", predictor, "openai/fake-model", {"user_query": "q"}) != key
+
+
+def test_lm_cache_evicts_oldest_entries():
+    cache = LMCache(":memory:", predictors=set(), max_entries=2)
+    for i in range(4):
+        cache.put(f"key{i}", "generate_search_query", {"main_topics": [str(i)]})
+
+    assert cache.evict() == 2
+    assert cache.get("key0") is None
+    assert cache.get("key3") == {"main_topics": ["3"]}
+
+
+def test_lm_cache_writes_dont_wait_for_other_workers(tmp_path):
+    # arrange
+    db_path = str(tmp_path / "lm_cache.db")
+    cache = LMCache(db_path, predictors=set(), max_entries=1)
+    cache.get("key0")
+    other_worker = apsw.Connection(db_path)
+    other_worker.execute("BEGIN IMMEDIATE")
+
+    # act
+    start = time.perf_counter()
+    for i in range(100):
+        cache.put(f"key{i}", "generate_search_query", {"main_topics": [str(i)]})
+    outputs = cache.get("key99")
+    seconds = time.perf_counter() - start
+    other_worker.execute("COMMIT")
+    cache.close()
+
+    # assert
+    assert outputs == {"main_topics": ["99"]}
+    assert seconds < 1.0
+    assert LMCache(db_path, predictors=set()).db.execute("SELECT key FROM lm_cache").fetchall() == [("key99",)]
@@ -0,0 +1,46 @@
+import dspy
+import pytest
+
+from src import metrics
+from src.lib import aanswer_query
+from src.metrics import Histogram, render
+
+
+def test_histogram_buckets_are_cumulative():
+    # arrange
+    histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+
+    # act
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage="search")
+    samples = {(suffix, labels.get("le")): value for suffix, labels, value in histogram.collect()[0].samples}
+
+    # assert
+    assert samples[("_bucket", "0.1")] == 2
+    assert samples[("_bucket", "1")] == 3
+    assert samples[("_bucket", "+Inf")] == samples[("_count", None)] == 4
+    assert samples[("_sum", None)] == pytest.approx(2.65)
+
+
+@pytest.mark.asyncio
+async def test_answer_records_every_stage(monkeypatch, stub_pipeline):
+    # arrange
+    # prefetched articles would make the counts of article fetches depend on timing
+    monkeypatch.setattr("src.lib.RETRIEVAL_MODE", "serial")
+    monkeypatch.setattr("src.metrics.STAGE_SECONDS", Histogram("test_stage_seconds", "Test.", ("stage", "result")))
+    stub_pipeline()
+
+    # act
+    events = [e async for e in aanswer_query("How does a hepatic adenoma look on MRI?", dspy.History(messages=[]))]
+
+    # assert
+    counts = metrics.STAGE_SECONDS.counts()
+    assert counts[("topic_extraction", "ok")] == 1
+    assert counts[("search", "miss")] == 1
+    assert counts[("article_fetch", "miss")] == 2
+    assert counts[("first_token", "ok")] == counts[("generation", "ok")] == 1
+    assert counts[("faithfulness_check", "faithful")] == 1
+    assert counts[("total", "answered")] == 1
+    assert metrics.hit_ratio("article_fetch") == 0.0
+    assert "wilhelm_cache_hit_ratio{cache=\"search\"} 0" in render()
+    assert len(events) > 3
@@ -0,0 +1,48 @@
+from src.passages import chunk_text, top_passages, passage_memory
+
+
+def test_chunk_text_merges_short_and_splits_long_paragraphs():
+    # arrange
+    text = "Epidemiology\nRare tumor.\n\n" + " ".join(["Sentence number one is here."] * 40)
+
+    # act
+    passages = chunk_text(text, max_words=50)
+
+    # assert
+    assert passages[0].startswith("Epidemiology\nRare tumor.")
+    assert all(len(p.split()) <= 50 for p in passages)
+    assert " ".join(" ".join(passages).split()) == " ".join(text.split())
+
+
+def test_top_passages_picks_relevant_passages_in_source_order():
+    # arrange
+    passage_memory.clear()
+    filler = " ".join(["History and etymology of the entity were described in the nineteenth century."] * 12)
+    adenoma = "\n".join([
+        filler,
+        "Hepatic adenomas are benign liver tumors associated with oral contraceptives.",
+        "On MRI, hepatic adenomas often contain intracellular fat with signal drop on opposed phase imaging.",
+        filler,
+        "Treatment is surgical resection for lesions larger than 5 cm.",
+    ])
+    fnh = "\n".join([
+        filler,
+        "Focal nodular hyperplasia has a central scar.",
+        "The central scar of focal nodular hyperplasia is T2 hyperintense on MRI.",
+        filler,
+        "FNH is the second most common benign liver tumor.",
+    ])
+
+    # act
+    passages = top_passages(
+        "MRI signal of hepatic adenoma versus the central scar of FNH",
+        ["https://radiopaedia.org/articles/hepatic-adenoma", "https://radiopaedia.org/articles/fnh"],
+        [adenoma, fnh],
+        k=2,
+    )
+
+    # assert
+    assert len(passages) == 2
+    assert "opposed phase" in passages[0]
+    assert "T2 hyperintense" in passages[1]
+    assert len(passage_memory) == 2
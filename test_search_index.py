@@ -0,0 +1,18 @@
+from src.search_index import singular, title_matches
+
+
+def test_title_matches_plurals():
+    assert title_matches("hepatic adenomas", "Hepatic adenoma")
+    assert title_matches("liver abscesses", "liver abscess")
+    assert title_matches("renal arteries", "renal artery")
+    assert title_matches("type 1 endoleaks", "Endoleak type 1")
+
+
+def test_title_matches_keeps_different_diseases_apart():
+    assert not title_matches("meningioma", "Meningitis")
+    assert not title_matches("hepatic adenoma", "hepatic adenomatosis")
+    assert not title_matches("type ii endoleak", "type iii endoleak")
+
+
+def test_singular_leaves_words_ending_in_s_alone():
+    assert [singular(w) for w in ("stenosis", "sinus", "abscess", "vertebrae")] == ["stenosis", "sinus", "abscess", "vertebra"]
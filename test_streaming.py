@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import mistletoe
+import pytest
+
+from src.lib import AnswerChunkEvent, FinalAnswerEvent, StopEvent, ConversationManager
+from src.streaming import IncrementalAnswer, stable_blocks_end
+from src.utils import answer_query_sse
+
+ANSWER = """Hepatic adenomas are **benign** liver tumors.
+
+## Imaging
+
+1. On CT they are
+   hypodense
+
+2. On MRI they
+
+   may contain fat
+
+- FNH
+- HCC
+
+```
+code
+
+more code
+```
+
+> a quote
+>
+> continued
+
+Final paragraph."""
+
+
+def test_stable_blocks_render_like_the_whole_answer():
+    # arrange
+    stable, blocks = 0, ""
+
+    # act / assert
+    for i in range(1, len(ANSWER) + 1):
+        end = stable_blocks_end(ANSWER[:i], stable)
+        assert end >= stable
+        blocks += mistletoe.markdown(ANSWER[stable:end]) if end > stable else ""
+        stable = end
+        assert blocks + mistletoe.markdown(ANSWER[stable:i]) == mistletoe.markdown(ANSWER[:i])
+    assert stable > len(ANSWER) // 2
+
+
+def test_incremental_frames_only_carry_new_blocks_and_the_tail():
+    # arrange
+    renderer = IncrementalAnswer()
+
+    # act
+    first = renderer.frame("First paragraph.\n\nSecond paragraph.\n\nThi")
+    second = renderer.frame("First paragraph.\n\nSecond paragraph.\n\nThird paragraph.\n\nFou")
+
+    # assert
+    assert 'sse-swap="answer-blocks"' in first and "First paragraph." in first
+    assert "event: answer-blocks" in second and "event: answer-tail" in second
+    assert "First paragraph." not in second
+    assert "Second paragraph." in second and "Third paragraph." in second and "Fou" in second
+
+
+@pytest.mark.asyncio
+async def test_answer_chunks_are_coalesced(monkeypatch):
+    # arrange
+    answer = " ".join(f"word{i}" for i in range(100))
+
+    async def fake_aanswer_query(query, history):
+        for i in range(1, len(answer) + 1):
+            yield AnswerChunkEvent(answer[:i])
+        yield FinalAnswerEvent(answer, {"urls": []})
+        yield StopEvent()
+
+    monkeypatch.setattr("src.utils.aanswer_query", fake_aanswer_query)
+    monkeypatch.setattr("src.utils.STREAM_FLUSH_MS", 10_000)
+    monkeypatch.setattr("src.utils.STREAM_FLUSH_CHARS", 200)
+    manager = ConversationManager()
+    conv_id, _ = manager.get_or_create_conversation()
+
+    # act
+    frames = [frame async for frame in answer_query_sse("q", conv_id, manager)]
+
+    # assert
+    assert len(frames) == 2 + len(answer) // 200 + 2
+    assert answer in frames[-2]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_chunks_are_sent_when_the_lm_pauses(monkeypatch):
+    # arrange
+    async def fake_aanswer_query(query, history):
+        yield AnswerChunkEvent("Hepatic")
+        yield AnswerChunkEvent("Hepatic adenomas")
+        # the LM pauses mid-answer
+        await asyncio.sleep(0.5)
+        yield FinalAnswerEvent("Hepatic adenomas are benign.", {"urls": []})
+        yield StopEvent()
+
+    monkeypatch.setattr("src.utils.aanswer_query", fake_aanswer_query)
+    monkeypatch.setattr("src.utils.STREAM_FLUSH_MS", 50)
+    manager = ConversationManager()
+    conv_id, _ = manager.get_or_create_conversation()
+    sent = []
+
+    # act
+    start = time.perf_counter()
+    async for frame in answer_query_sse("q", conv_id, manager):
+        sent.append((time.perf_counter() - start, frame))
+
+    # assert
+    seconds, frame = sent[1]
+    assert "adenomas" in frame
+    assert seconds < 0.3
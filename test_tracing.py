@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+
+import dspy
+import pytest
+
+from src.tracing import sample_request, sampled_callback, start_tracing
+
+
+class RecordingCallback(dspy.utils.callback.BaseCallback):
+    def __init__(self):
+        self.calls = []
+
+    def on_module_start(self, call_id, instance, inputs):
+        self.calls.append(call_id)
+
+
+def test_unsampled_requests_skip_the_callback(monkeypatch):
+    # arrange
+    callback = sampled_callback(RecordingCallback)()
+    monkeypatch.setattr("src.tracing.random.random", iter([0.1, 0.9]).__next__)
+    monkeypatch.setattr("src.tracing.TRACE_SAMPLE_RATE", 0.5)
+
+    def request(call_id):
+        sample_request()
+        callback.on_module_start(call_id, None, {})
+
+    # act
+    contextvars.copy_context().run(request, "sampled")
+    contextvars.copy_context().run(request, "dropped")
+
+    # assert
+    assert callback.calls == ["sampled"]
+    assert isinstance(callback, RecordingCallback)
+
+
+@pytest.mark.asyncio
+async def test_sampling_covers_the_tasks_of_a_request(monkeypatch):
+    # arrange
+    callback = sampled_callback(RecordingCallback)()
+    monkeypatch.setattr("src.tracing.TRACE_SAMPLE_RATE", 0.0)
+
+    async def request():
+        sample_request()
+        await asyncio.create_task(asyncio.to_thread(callback.on_module_start, "check", None, {}))
+
+    # act
+    await asyncio.create_task(request())
+
+    # assert
+    assert callback.calls == []
+
+
+@pytest.mark.asyncio
+async def test_tracing_off(monkeypatch):
+    # arrange
+    monkeypatch.setattr("src.tracing.TRACING_MODE", "off")
+
+    # act / assert
+    assert await start_tracing() is False
+    assert await start_tracing("file", sample_rate=0) is False
+    with pytest.raises(ValueError):
+        await start_tracing("console")